@@ -1,51 +1,65 @@
 """Submodule that manages the REST-API for the HttpToMqtt Server."""
 
-import re
+import asyncio
 import datetime
-from typing import Union
-from logging import getLogger
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import List, Union
+from logging import getLogger, DEBUG
 
+import orjson
 import uvicorn
-from fastapi import FastAPI, Response, status
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.status import (HTTP_200_OK, HTTP_304_NOT_MODIFIED, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND,
+                              HTTP_406_NOT_ACCEPTABLE, HTTP_500_INTERNAL_SERVER_ERROR,
+                              HTTP_504_GATEWAY_TIMEOUT)
 
 from HttpToMqtt.Types import *
 
 TIMEOUT = 5
+# maximum number of positions /light/loadESP32 sends to an ESP32 without having received their ACKs
+LOAD_WINDOW = 32
+# MQTT topics below pbl/<MAC-address>/ that commands are published to
+TOPIC_SUFFIXES = ("light/set", "light/unset", "light/allOn", "light/allOff",
+                  "config/create_Position", "config/update_Position", "config/delete_Position",
+                  "config/reset", "config/get")
 
 log = getLogger(__name__)
 
 
-def color_string_to_byte_array(color_as_string: str) -> bytearray:
+@lru_cache(maxsize=256)
+def color_string_to_byte_array(color_as_string: str) -> bytes:
     """
-    Convert color string to a bytearray with three bytes, each one
+    Convert color string to bytes with three bytes, each one
     for the RGB respectively.
     If the specified format is not adhered to then None is returned.
+    Results are cached because clients usually pick from a small palette of colors,
+    which is why immutable bytes are returned.
 
     Parameters
     -------
     color_as_string : str
-        String containing the RGB values to be converted to a bytearray.
+        String containing the RGB values to be converted to bytes.
         Format has to be '#FFFFFF' just containing hex values. Not case-sensitive.
 
     Returns
     -------
-    A bytearray containing the three RGB values.
+    Bytes containing the three RGB values.
     If the specified format is not adhered to then None is returned.
     """
-    res = re.match("#[0-9a-fA-F]{6}", color_as_string)
-    if res is not None:
-        res = res.string[0:7].upper()
-        log.debug("Got RGB value: %s", str(res))
+    result = None
+    if len(color_as_string) == 7 and color_as_string[0] == "#":
         try:
-            result = bytearray.fromhex(res[1:])
-        except ValueError as err:
-            result = None
-            log.warning("Got following ValueError while converting %s to bytearray.", str(res[1:]))
-            log.warning(str(err))
-    else:
+            result = bytes.fromhex(color_as_string[1:])
+        except ValueError:
+            pass
+    # fromhex skips whitespace, so '#FF FF ' would otherwise pass with only two bytes
+    if result is None or len(result) != 3:
         log.warning("The given string '%s' doesn't comply with the expected format. "
                     "Expected format is '#FFFFFF'", color_as_string)
-        result = None
+        return None
     return result
 
 
@@ -68,9 +82,14 @@ class Api:
     data_manager : DataManager
         Object representing the data manager
         that adds, updates, finds and deletes data from the JSON database.
+    __topics : dict[str, dict[str, str]]
+        Maps the MAC-address of a stored ESP32 to its MQTT topics, keyed by the
+        suffixes in TOPIC_SUFFIXES.
     """
 
-    app = FastAPI()
+    app = FastAPI(default_response_class=ORJSONResponse)
+    # compress larger responses like getShelves or the OpenAPI schema, short ones are sent as is
+    app.add_middleware(GZipMiddleware, minimum_size=500)
 
     def __init__(self, ip: str, port: int, mqtt, data_manager):
         """Initialize an Api object which handles the REST-API"""
@@ -78,335 +97,317 @@ class Api:
         self.port = port
         self.mqtt = mqtt
         self.data_manager = data_manager
+        self.__topics: dict[str, dict[str, str]] = {}
         self.__create_paths()
 
     def run(self):
-        """Run the REST-API."""
-        uvicorn.run("HttpToMqtt.Api:Api.app", host=self.ip, port=self.port, log_level="info")
-
-    # pylint: disable=too-many-statements
+        """
+        Run the REST-API on the uvloop event loop with the httptools HTTP parser
+        (both shipped with uvicorn[standard]). If one of them isn't installed (uvloop
+        isn't available on Windows) uvicorn picks the best available one instead.
+        Access logs are only written in debug mode.
+        """
+        loop = "uvloop" if find_spec("uvloop") is not None else "auto"
+        http = "httptools" if find_spec("httptools") is not None else "auto"
+        log.debug("Running uvicorn with loop=%s and http=%s", loop, http)
+        uvicorn.run("HttpToMqtt.Api:Api.app", host=self.ip, port=self.port, log_level="info",
+                    loop=loop, http=http, access_log=log.isEnabledFor(DEBUG))
+
+    def __get_topics(self, mac_address: str) -> dict[str, str]:
+        """
+        Get all MQTT topics of the ESP32 with the given MAC-address, keyed by the
+        suffixes in TOPIC_SUFFIXES. The topics are built once per stored ESP32, other
+        MAC-addresses come from clients and are not cached, so the cache can't grow unbounded.
+        """
+        topics = self.__topics.get(mac_address)
+        if topics is None:
+            topics = {suffix: f"pbl/{mac_address}/{suffix}" for suffix in TOPIC_SUFFIXES}
+            if self.data_manager.mac_address_exists(mac_address):
+                self.__topics[mac_address] = topics
+        return topics
+
+    # pylint: disable=too-many-statements, too-many-locals
     def __create_paths(self):
-        """Create all paths for the API."""
+        """
+        Create all paths for the API. The handlers reach the DataManager, the Mqtt module and
+        the topic cache through the locals bound here, so they don't look them up on self
+        on every request.
+        """
+        data_manager = self.data_manager
+        mqtt = self.mqtt
+        get_topics = self.__get_topics
+
+        def __unexpected(response: Response, route: str) -> str:
+            response.status_code = HTTP_500_INTERNAL_SERVER_ERROR
+            log.warning("Something unexpected happened, while handling %s request.", route)
+            return "Something unexpected happened."
 
-        def __validate_turn_on_off_parameters(conf: Union[TurnOn, TurnOff],
-                                              mac_address: str) -> (int, str):
-            if mac_address is None:
-                return (status.HTTP_404_NOT_FOUND,
+        def __unresponsive_message(mac_address: str) -> str:
+            return (f"ESP32 with the Mac_Address {mac_address} recently didn't respond in time "
+                    f"and hasn't been heard of since, so the command wasn't sent.")
+
+        async def __send(mac_address: str, select_queue: str, topic: str, payload: bytes, *,
+                         route: str, timeout: int = TIMEOUT,
+                         timeout_note: str = ".") -> (int, Union[str, None]):
+            # Publishes the payload to the topic of the ESP32. Returns the status code and None
+            # if the ESP32 sent an ACK, otherwise the status code and the message for the client.
+            if mqtt.is_unresponsive(mac_address):
+                return HTTP_504_GATEWAY_TIMEOUT, __unresponsive_message(mac_address)
+            status_code = await mqtt.publish_with_ack_async(
+                timeout, mac_address,
+                select_queue=select_queue,
+                topic=get_topics(mac_address)[topic],
+                payload=payload
+            )
+            if status_code == HTTP_504_GATEWAY_TIMEOUT:
+                return (status_code,
+                        f"Timeout warning! ESP32 with the Mac_Address {mac_address} didn't "
+                        f"respond in time{timeout_note}")
+            if status_code == HTTP_200_OK:
+                return status_code, None
+
+            log.warning("Something unexpected happened, while handling %s request.", route)
+            return HTTP_500_INTERNAL_SERVER_ERROR, "Something unexpected happened."
+
+        async def __publish(response: Response, mac_address: str, select_queue: str, topic: str,
+                            payload: bytes, *, route: str, timeout: int = TIMEOUT,
+                            timeout_note: str = ".") -> Union[str, None]:
+            # Like __send, but sets the status code of the response and only returns the message.
+            response.status_code, message = await __send(
+                mac_address, select_queue, topic, payload,
+                route=route, timeout=timeout, timeout_note=timeout_note)
+            return message
+
+        def __not_modified(request: Request, etag: str) -> Union[Response, None]:
+            # The client already has the data of this version, so nothing has to be serialized.
+            if_none_match = request.headers.get("if-none-match")
+            if if_none_match is None:
+                return None
+            if if_none_match.strip() == "*" or etag in (tag.strip() for tag in
+                                                         if_none_match.split(",")):
+                return Response(status_code=HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+            return None
+
+        async def __iter_shelves_json(shelves: List[Shelf]):
+            # Serializes one shelf at a time, so a large ShelfArray is never held in memory
+            # as a single JSON string. It is an async generator, so the chunks are produced on
+            # the event loop instead of being handed to the threadpool one by one.
+            yield b'{"Shelves":['
+            for index, shelf in enumerate(shelves):
+                if index:
+                    yield b","
+                yield orjson.dumps(shelf.dict())
+            yield b"]}"
+
+        async def __turn_on(conf: TurnOn) -> (int, str):
+            bundle = data_manager.get_shelf_bundle(conf.ShelfNumber)
+            if bundle is None:
+                return (HTTP_404_NOT_FOUND,
                         f"The shelf with number {conf.ShelfNumber} was not found in our database "
                         f"or check if an ESP32 has been assigned to this ShelfNumber.")
-
-            if conf.PositionId > 255 or conf.PositionId < 0:
-                return (status.HTTP_400_BAD_REQUEST,
-                        f"The PositionId {conf.PositionId} is either smaller than one or bigger "
-                        f"than 255. The ID must be an int in range 0-255 in order to be able to be "
-                        f"casted to a byte.")
-
-            if not self.data_manager.position_id_exists(conf.ShelfNumber, conf.PositionId):
-                return (status.HTTP_404_NOT_FOUND,
+            position = bundle.positions.get(conf.PositionId)
+            if position is None:
+                return (HTTP_404_NOT_FOUND,
                         f"The position with ID {conf.PositionId} in the shelf with number "
                         f"{conf.ShelfNumber} was not found in our database.")
-            return status.HTTP_200_OK, ""
-
-        @self.app.post("/light/turnOn")
-        def turn_on(conf: TurnOn, response: Response):
-            """Turn on all LEDs of a position in a shelf."""
-            mac_address: str = self.data_manager.get_mac_address_by_shelf_number(conf.ShelfNumber)
-            response.status_code, ret_str = __validate_turn_on_off_parameters(conf, mac_address)
-            if response.status_code != status.HTTP_200_OK:
-                return ret_str
             colors_byte_array = color_string_to_byte_array(conf.Color)
             if colors_byte_array is None:
-                response.status_code = status.HTTP_400_BAD_REQUEST
-                return (f"The parameter Color '{conf.Color}' doesn't comply with the expected "
+                return (HTTP_400_BAD_REQUEST,
+                        f"The parameter Color '{conf.Color}' doesn't comply with the expected "
                         f"format. Expected format is '#FFFFFF'")
-            leds = self.data_manager.get_leds_by_shelf_number_and_position_id(conf.ShelfNumber,
-                                                                              conf.PositionId)
-            if leds is None:
-                response.status_code = status.HTTP_404_NOT_FOUND
-                return (
-                    f"The leds in the position with ID {conf.PositionId} in the shelf with number "
-                    f"{conf.ShelfNumber} were not found in our database or is None (NullPointer).")
-
-            leds_byte_array = bytearray(leds)
-            leds_byte_array.extend(colors_byte_array)
-            response.status_code = self.mqtt.publish_with_ack(TIMEOUT, mac_address,
-                                                              select_queue="light_ack",
-                                                              topic=f"pbl/{mac_address}/light/set",
-                                                              payload=leds_byte_array)
+            mac_address = bundle.mac_address
+            leds = position.LEDs
+
+            status_code, message = await __send(mac_address, "light_ack", "light/set",
+                                                bytes(leds) + colors_byte_array,
+                                                route="/light/turnOn")
+            if message is not None:
+                return status_code, message
+            return (status_code,
+                    f"Turned LEDs {leds} on on shelf with number {conf.ShelfNumber} "
+                    f"in position with ID {conf.PositionId} with color {conf.Color}.")
 
-            if response.status_code == status.HTTP_504_GATEWAY_TIMEOUT:
-                return (f"Timeout warning! ESP32 with the Mac_Address {mac_address} didn't "
-                        f"respond in time.")
-            if response.status_code == status.HTTP_200_OK:
-                return (f"Turned LEDs {leds} on on shelf with number {conf.ShelfNumber} "
-                        f"in position with ID {conf.PositionId} with color {conf.Color}.")
+        @self.app.post("/light/turnOn")
+        async def turn_on(conf: TurnOn, response: Response):
+            """Turn on all LEDs of a position in a shelf."""
+            response.status_code, ret_str = await __turn_on(conf)
+            return ret_str
 
-            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            log.warning("Something unexpected happened, while handling /light/turnOn request.")
-            return "Something unexpected happened."
+        @self.app.post("/light/setManyShelves")
+        async def set_many_shelves(confs: List[TurnOn], response: Response):
+            """
+            Turn on the LEDs of several positions, possibly on several shelves, at once.
+            All commands are published together and their ACKs are awaited concurrently.
+            Returns the message of every command in the order they were sent. The status
+            code is 200 if all commands succeeded, otherwise the one of the first that failed.
+            """
+            results = await asyncio.gather(*(__turn_on(conf) for conf in confs))
+            response.status_code = next((status_code for status_code, _ in results
+                                         if status_code != HTTP_200_OK),
+                                        HTTP_200_OK)
+            return [ret_str for _, ret_str in results]
 
         @self.app.post("/light/turnOff")
-        def turn_off(conf: TurnOff, response: Response):
+        async def turn_off(conf: TurnOff, response: Response):
             """Turn off all LEDs of a position."""
 
-            mac_address: str = self.data_manager.get_mac_address_by_shelf_number(conf.ShelfNumber)
-            response.status_code, ret_str = __validate_turn_on_off_parameters(conf, mac_address)
-            if response.status_code != status.HTTP_200_OK:
-                return ret_str
+            bundle = data_manager.get_shelf_bundle(conf.ShelfNumber)
+            if bundle is None:
+                response.status_code = HTTP_404_NOT_FOUND
+                return (f"The shelf with number {conf.ShelfNumber} was not found in our database "
+                        f"or check if an ESP32 has been assigned to this ShelfNumber.")
+            position = bundle.positions.get(conf.PositionId)
+            if position is None:
+                response.status_code = HTTP_404_NOT_FOUND
+                return (f"The position with ID {conf.PositionId} in the shelf with number "
+                        f"{conf.ShelfNumber} was not found in our database.")
+            leds = position.LEDs
 
-            leds = self.data_manager.get_leds_by_shelf_number_and_position_id(conf.ShelfNumber,
-                                                                              conf.PositionId)
-            if leds is None:
-                response.status_code = status.HTTP_404_NOT_FOUND
-                return (
-                    f"The leds in the position with ID {conf.PositionId} in the shelf with number "
-                    f"{conf.ShelfNumber} were not found in our database or is None (NullPointer).")
-
-            leds_byte_array = bytearray(leds)
-            response.status_code = self.mqtt.publish_with_ack(
-                TIMEOUT, mac_address,
-                select_queue="light_ack",
-                topic=f"pbl/{mac_address}"
-                      f"/light/unset",
-                payload=leds_byte_array)
-
-            if response.status_code == status.HTTP_504_GATEWAY_TIMEOUT:
-                return (f"Timeout warning! ESP32 with the Mac_Address {mac_address} didn't "
-                        f"respond in time.")
-            if response.status_code == status.HTTP_200_OK:
-                return (f"Turned LEDs {leds} off on shelf with number {conf.ShelfNumber} "
-                        f"in position with ID {conf.PositionId}.")
+            message = await __publish(response, bundle.mac_address, "light_ack", "light/unset",
+                                      bytes(leds), route="/light/turnOff")
+            if message is not None:
+                return message
 
-            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            log.warning("Something unexpected happened, while handling /light/turnOff request.")
-            return "Something unexpected happened."
+            return (f"Turned LEDs {leds} off on shelf with number {conf.ShelfNumber} "
+                    f"in position with ID {conf.PositionId}.")
 
         @self.app.post("/light/turnOnAll")
-        def turn_on_all(shelf_number: ShelfSelectionWithColor, response: Response):
+        async def turn_on_all(shelf_number: ShelfSelectionWithColor, response: Response):
             """Turn on all LEDs from all stored positions on a Shelf."""
-            mac_address = self.data_manager.get_mac_address_by_shelf_number(
+            mac_address = data_manager.get_mac_address_by_shelf_number(
                 shelf_number.ShelfNumber)
             if mac_address is None:
-                response.status_code = status.HTTP_404_NOT_FOUND
+                response.status_code = HTTP_404_NOT_FOUND
                 return (f"The shelf with number {shelf_number.ShelfNumber} was not found in our "
                         f"database or check if an ESP32 has been assigned to this ShelfNumber.")
 
             colors_byte_array = color_string_to_byte_array(shelf_number.Color)
             if colors_byte_array is None:
-                response.status_code = status.HTTP_400_BAD_REQUEST
+                response.status_code = HTTP_400_BAD_REQUEST
                 return ("The parameter Color doesn't comply with the expected "
                         "format. Expected format is '#FFFFFF'")
-            response.status_code = self.mqtt.publish_with_ack(
-                TIMEOUT, mac_address, select_queue="light_ack",
-                topic=f"pbl/{mac_address}/light/allOn",
-                payload=bytearray([colors_byte_array[0],
-                                   colors_byte_array[1],
-                                   colors_byte_array[2]])
-            )
+            message = await __publish(response, mac_address, "light_ack", "light/allOn",
+                                      colors_byte_array, route="/light/turnOnAll")
+            if message is not None:
+                return message
 
-            if response.status_code == status.HTTP_504_GATEWAY_TIMEOUT:
-                return (f"Timeout warning! ESP32 with the Mac_Address {mac_address} didn't "
-                        f"respond in time.")
-            if response.status_code == status.HTTP_200_OK:
-                return f"Turned all positions on on shelf with number {shelf_number.ShelfNumber}"
-
-            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            log.warning("Something unexpected happened, while handling /light/turnOnAll request.")
-            return "Something unexpected happened."
+            return f"Turned all positions on on shelf with number {shelf_number.ShelfNumber}"
 
         @self.app.post("/light/turnOffAll")
-        def turn_off_all(shelf_number: ShelfSelection, response: Response):
+        async def turn_off_all(shelf_number: ShelfSelection, response: Response):
             """Turn off all LEDs from all stored positions on a shelf."""
-            mac_address = self.data_manager.get_mac_address_by_shelf_number(
+            mac_address = data_manager.get_mac_address_by_shelf_number(
                 shelf_number.ShelfNumber)
             if mac_address is None:
-                response.status_code = status.HTTP_404_NOT_FOUND
+                response.status_code = HTTP_404_NOT_FOUND
                 return (f"The shelf with number {shelf_number.ShelfNumber} was not found in our "
                         f"database or check if an ESP32 has been assigned to this ShelfNumber.")
 
-            response.status_code = self.mqtt.publish_with_ack(
-                TIMEOUT, mac_address, select_queue="light_ack",
-                topic=f"pbl/{mac_address}/light/allOff",
-                payload=bytearray([])
-            )
-
-            if response.status_code == status.HTTP_504_GATEWAY_TIMEOUT:
-                return (f"Timeout warning! ESP32 with the Mac_Address {mac_address} didn't "
-                        f"respond in time.")
-            if response.status_code == status.HTTP_200_OK:
-                return f"Turned all positions off on shelf with number {shelf_number.ShelfNumber}"
+            message = await __publish(response, mac_address, "light_ack", "light/allOff", b"",
+                                      route="/light/turnOffAll")
+            if message is not None:
+                return message
 
-            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            log.warning("Something unexpected happened, while handling /light/turnOffAll request.")
-            return "Something unexpected happened."
+            return f"Turned all positions off on shelf with number {shelf_number.ShelfNumber}"
 
         def __validate_set_unset_parameters(conf: Union[SetLED, UnsetLED]) -> (int, str):
-            if not self.data_manager.mac_address_exists(conf.Mac_Address):
-                return (status.HTTP_404_NOT_FOUND,
+            if not data_manager.mac_address_exists(conf.Mac_Address):
+                return (HTTP_404_NOT_FOUND,
                         f"The shelf with the MAC-Address {conf.Mac_Address} "
                         f"was not found in our database.")
-            for led in conf.LEDs:
-                if led > 255 or led < 0:
-                    return (status.HTTP_400_BAD_REQUEST,
-                            f"The parameter LED {led} in the given LED Array {conf.LEDs} is either "
-                            f"smaller than one or bigger than 255. LED must be an int in range "
-                            f"0-255 in order to be able to be casted to a byte.")
-            return status.HTTP_200_OK, ""
+            return HTTP_200_OK, ""
 
         @self.app.post("/light/setLEDs")
-        def set_leds(conf: SetLED, response: Response):
+        async def set_leds(conf: SetLED, response: Response):
             """Turn on specified LED on the specified shelf independently of a position ID."""
             response.status_code, ret_str = __validate_set_unset_parameters(conf)
-            if response.status_code != status.HTTP_200_OK:
+            if response.status_code != HTTP_200_OK:
                 return ret_str
 
             colors_byte_array = color_string_to_byte_array(conf.Color)
             if colors_byte_array is None:
-                response.status_code = status.HTTP_400_BAD_REQUEST
+                response.status_code = HTTP_400_BAD_REQUEST
                 return (f"The parameter Color '{conf.Color}' doesn't comply with the expected "
                         f"format. Expected format is '#FFFFFF'")
 
-            leds_byte_array = bytearray(conf.LEDs)
-            leds_byte_array.extend(colors_byte_array)
-            response.status_code = self.mqtt.publish_with_ack(
-                TIMEOUT, conf.Mac_Address, select_queue="light_ack",
-                topic=f"pbl/{conf.Mac_Address}/light/set",
-                payload=leds_byte_array
-            )
+            message = await __publish(response, conf.Mac_Address, "light_ack", "light/set",
+                                      bytes(conf.LEDs) + colors_byte_array,
+                                      route="/light/setLEDs")
+            if message is not None:
+                return message
 
-            if response.status_code == status.HTTP_504_GATEWAY_TIMEOUT:
-                return (f"Timeout warning! ESP32 with the Mac_Address {conf.Mac_Address} didn't "
-                        f"respond in time.")
-            if response.status_code == status.HTTP_200_OK:
-                return (f"Set LEDs {conf.LEDs} on ESP32 with Mac_Address {conf.Mac_Address} "
-                        f"with color {conf.Color}")
-
-            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            log.warning("Something unexpected happened, while handling /light/setLEDs request.")
-            return "Something unexpected happened."
+            return (f"Set LEDs {conf.LEDs} on ESP32 with Mac_Address {conf.Mac_Address} "
+                    f"with color {conf.Color}")
 
         @self.app.post("/light/unsetLEDs")
-        def unset_leds(conf: UnsetLED, response: Response):
+        async def unset_leds(conf: UnsetLED, response: Response):
             """Turn off specified LED on the specified shelf independently of a position ID."""
             response.status_code, ret_str = __validate_set_unset_parameters(conf)
-            if response.status_code != status.HTTP_200_OK:
+            if response.status_code != HTTP_200_OK:
                 return ret_str
 
-            leds_byte_array = bytearray(conf.LEDs)
-            response.status_code = self.mqtt.publish_with_ack(
-                TIMEOUT, conf.Mac_Address, select_queue="light_ack",
-                topic=f"pbl/{conf.Mac_Address}/light/unset",
-                payload=leds_byte_array
-            )
-
-            if response.status_code == status.HTTP_504_GATEWAY_TIMEOUT:
-                return (f"Timeout warning! ESP32 with the Mac_Address {conf.Mac_Address} didn't "
-                        f"respond in time.")
-            if response.status_code == status.HTTP_200_OK:
-                return f"Unset LEDs {conf.LEDs} on ESP32 with Mac_Address {conf.Mac_Address}."
+            message = await __publish(response, conf.Mac_Address, "light_ack", "light/unset",
+                                      bytes(conf.LEDs), route="/light/unsetLEDs")
+            if message is not None:
+                return message
 
-            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            log.warning("Something unexpected happened, while handling /light/unSetLEDs request.")
-            return "Something unexpected happened."
+            return f"Unset LEDs {conf.LEDs} on ESP32 with Mac_Address {conf.Mac_Address}."
 
-        def __validate_shelf(shelf_position: Union[ShelfPosition, DeletePosition],
-                             shelf: Shelf) -> (int, str):
-            if shelf is None:
-                return (status.HTTP_404_NOT_FOUND,
-                        f"The shelf with number {shelf_position.ShelfNumber} was not found in our "
-                        f"database or check if an ESP32 has been assigned to this ShelfNumber.")
-            if shelf_position.PositionId > 255 or shelf_position.PositionId < 0:
-                return (status.HTTP_400_BAD_REQUEST,
-                        f"The PositionId {shelf_position.PositionId} is either smaller than one or "
-                        f"bigger than 255. The ID must be an int in range 0-255 in order to be "
-                        f"able to be casted to a byte.")
-            return status.HTTP_200_OK, ""
-
-        def __publish_create_update_position(shelf_position: ShelfPosition, mac_address: str,
-                                             create: bool):
-            list_of_int: list[int] = [shelf_position.PositionId]
-            list_of_int.extend(shelf_position.LEDs)
+        async def __publish_create_update_position(shelf_position: ShelfPosition,
+                                                   mac_address: str, create: bool):
             if create:
-                status_code = self.mqtt.publish_with_ack(
-                    TIMEOUT, mac_address, select_queue="config_ack",
-                    topic=f"pbl/{mac_address}/config/create_Position",
-                    payload=bytearray(list_of_int)
-                )
+                topic, route, action = ("config/create_Position", "/light/createPosition",
+                                        "created")
             else:
-                status_code = self.mqtt.publish_with_ack(
-                    TIMEOUT, mac_address, select_queue="config_ack",
-                    topic=f"pbl/{mac_address}/config/update_Position",
-                    payload=bytearray(list_of_int)
-                )
-
-            if status_code == status.HTTP_504_GATEWAY_TIMEOUT:
-                if create:
-                    return (status.HTTP_504_GATEWAY_TIMEOUT,
-                            f"Timeout warning! ESP32 with the Mac_Address {mac_address} didn't "
-                            f"respond in time. Cannot guarantee shelf position was created!")
-
-                return (status.HTTP_504_GATEWAY_TIMEOUT,
-                        f"Timeout warning! ESP32 with the Mac_Address {mac_address} didn't "
-                        f"respond in time. Cannot guarantee shelf position was updated!")
-            return status_code, ""
+                topic, route, action = ("config/update_Position", "/light/updatePosition",
+                                        "updated")
+            status_code, message = await __send(
+                mac_address, "config_ack", topic,
+                bytes((shelf_position.PositionId, *shelf_position.LEDs)), route=route,
+                timeout_note=f". Cannot guarantee shelf position was {action}!")
+            return status_code, message or ""
 
         @self.app.put("/light/createPosition")
-        def create_position(shelf_position: ShelfPosition, response: Response):
+        async def create_position(shelf_position: ShelfPosition, response: Response):
             """Create Position for a shelf."""
-            mac_address = self.data_manager.get_mac_address_by_shelf_number(
-                shelf_position.ShelfNumber
-            )
-            if mac_address is None:
-                response.status_code = status.HTTP_404_NOT_FOUND
+            bundle = data_manager.get_shelf_bundle(shelf_position.ShelfNumber)
+            if bundle is None:
+                response.status_code = HTTP_404_NOT_FOUND
                 return (f"The shelf with number {shelf_position.ShelfNumber} was not found in our "
                         f"database or check if an ESP32 has been assigned to this ShelfNumber.")
-            if self.data_manager.position_id_exists(shelf_position.ShelfNumber,
-                                                    shelf_position.PositionId):
-                response.status_code = status.HTTP_406_NOT_ACCEPTABLE
+            if shelf_position.PositionId in bundle.positions:
+                response.status_code = HTTP_406_NOT_ACCEPTABLE
                 return (
                     f"The position with ID {shelf_position.PositionId} in the shelf with "
                     f"number {shelf_position.ShelfNumber} "
                     f"already exists so cannot create position. Maybe you are trying to update an "
                     f"existing position? Then use the route light/updatePosition")
-            shelf = self.data_manager.get_shelf_by_shelf_number(shelf_position.ShelfNumber)
-            response.status_code, ret_str = __validate_shelf(shelf_position, shelf)
-            if response.status_code != status.HTTP_200_OK:
-                return ret_str
-            shelf = self.data_manager.get_shelf_by_shelf_number(shelf_position.ShelfNumber)
-            response.status_code, ret_str = __validate_shelf(shelf_position, shelf)
-            if response.status_code != status.HTTP_200_OK:
-                return ret_str
-
-            if self.data_manager.leds_exists(shelf_position.LEDs, shelf_position.ShelfNumber):
-                response.status_code = status.HTTP_406_NOT_ACCEPTABLE
+            if any(led in bundle.leds for led in shelf_position.LEDs):
+                response.status_code = HTTP_406_NOT_ACCEPTABLE
                 return (f"Cannot create position because one or more of the sent LEDs "
                         f"{shelf_position.LEDs} is already being used by another shelf position "
                         f"in the shelf with number {shelf_position.ShelfNumber}. "
                         f"Try using another LED array.")
 
-            response.status_code, ret_str = __publish_create_update_position(shelf_position,
-                                                                             mac_address,
-                                                                             True)
+            response.status_code, ret_str = await __publish_create_update_position(
+                shelf_position, bundle.mac_address, True)
             if ret_str != "":
                 return ret_str
 
-            if response.status_code == status.HTTP_200_OK:
-                if self.data_manager.add_position(shelf, shelf_position):
+            if response.status_code == HTTP_200_OK:
+                if data_manager.add_position(bundle.shelf, shelf_position):
                     return (f"Added position with ID {shelf_position.PositionId} on shelf with "
                             f"number {shelf_position.ShelfNumber} with LEDs {shelf_position.LEDs}.")
 
-                response.status_code = status.HTTP_406_NOT_ACCEPTABLE
+                response.status_code = HTTP_406_NOT_ACCEPTABLE
                 return (f"Received an ACK from ESP32 but couldn't add position with ID "
                         f"{shelf_position.PositionId} on shelf with number "
                         f"{shelf_position.ShelfNumber} with LEDs {shelf_position.LEDs}.")
 
-            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            log.warning("Something unexpected happened, while handling "
-                        "/light/createPosition request.")
-            return "Something unexpected happened."
+            return __unexpected(response, "/light/createPosition")
 
         @self.app.put("/light/createShelf")
-        def create_shelf(shelf: Shelf, response: Response):
+        async def create_shelf(shelf: Shelf, response: Response):
             """
             Create a Shelf in the database. For this there must be an ESP32
             that has registered (exists in the database) and is available
@@ -415,82 +416,68 @@ class Api:
             Positions should be an empty list of ShelfPositions
             (Positions: List[ShelfPosition] = []).
             """
-            if self.data_manager.shelf_exists(shelf.ShelfNumber):
-                response.status_code = status.HTTP_406_NOT_ACCEPTABLE
+            if data_manager.shelf_exists(shelf.ShelfNumber):
+                response.status_code = HTTP_406_NOT_ACCEPTABLE
                 return (f"Cannot create Shelf because the given shelf number {shelf.ShelfNumber} "
                         f"is already being used. Try using another shelf number.")
-            if not self.data_manager.mac_address_exists(shelf.Mac_Address):
-                response.status_code = status.HTTP_404_NOT_FOUND
-                return (f"Cannot create Shelf because the given MAC-address {shelf.Mac_Address} "
-                        "doesn't exist in our database, which means that the ESP32 with this "
-                        "MAC-address hasn't registered to the database.")
-            esp32 = self.data_manager.get_esp32_by_mac_address(shelf.Mac_Address)
+            esp32 = data_manager.get_esp32_by_mac_address(shelf.Mac_Address)
             if esp32 is None:
-                response.status_code = status.HTTP_404_NOT_FOUND
+                response.status_code = HTTP_404_NOT_FOUND
                 return (f"Cannot create Shelf because the given MAC-address {shelf.Mac_Address} "
                         "doesn't exist in our database, which means that the ESP32 with this "
                         "MAC-address hasn't registered to the database.")
             if esp32.isUsed:
-                response.status_code = status.HTTP_406_NOT_ACCEPTABLE
+                response.status_code = HTTP_406_NOT_ACCEPTABLE
                 return (f"Cannot create Shelf because the ESP32 with given MAC-address "
                         f"{shelf.Mac_Address} "
                         f"is already being used by another Shelf.")
-            if self.data_manager.add_shelf(shelf):
-                response.status_code = status.HTTP_200_OK
+            if data_manager.add_shelf(shelf):
+                response.status_code = HTTP_200_OK
                 return f"Successfully created Shelf {shelf}!"
-            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+            response.status_code = HTTP_500_INTERNAL_SERVER_ERROR
             return f"Couldn't create Shelf {shelf}. Check message from HttpToMqtt Server."
 
         @self.app.put("/light/updatePosition")
-        def update_position(shelf_position: ShelfPosition, response: Response):
+        async def update_position(shelf_position: ShelfPosition, response: Response):
             """Update a position on a shelf."""
-            mac_address = self.data_manager.get_mac_address_by_shelf_number(
-                shelf_position.ShelfNumber
-            )
-            if mac_address is None:
-                response.status_code = status.HTTP_404_NOT_FOUND
+            bundle = data_manager.get_shelf_bundle(shelf_position.ShelfNumber)
+            if bundle is None:
+                response.status_code = HTTP_404_NOT_FOUND
                 return (f"The shelf with number {shelf_position.ShelfNumber} was not found in our "
                         f"database or check if an ESP32 has been assigned to this ShelfNumber.")
-            if not self.data_manager.position_id_exists(shelf_position.ShelfNumber,
-                                                        shelf_position.PositionId):
-                response.status_code = status.HTTP_406_NOT_ACCEPTABLE
+            position_id = shelf_position.PositionId
+            if position_id not in bundle.positions:
+                response.status_code = HTTP_406_NOT_ACCEPTABLE
                 return (
                     f"The position with ID {shelf_position.PositionId} in the shelf "
                     f"with number {shelf_position.ShelfNumber} "
                     f"doesn't exist so cannot update position. Maybe you are trying to create a "
                     f"position? Then use the route light/createPosition")
-            shelf = self.data_manager.get_shelf_by_shelf_number(shelf_position.ShelfNumber)
-            response.status_code, ret_str = __validate_shelf(shelf_position, shelf)
-            if response.status_code != status.HTTP_200_OK:
-                return ret_str
-
-            if self.data_manager.leds_exists_exclusive(shelf_position):
-                response.status_code = status.HTTP_406_NOT_ACCEPTABLE
+            # LEDs of the position itself may be reused by its update
+            if any(bundle.leds.get(led, position_id) != position_id
+                   for led in shelf_position.LEDs):
+                response.status_code = HTTP_406_NOT_ACCEPTABLE
                 return (f"Cannot create position because one or more of the sent LEDs "
                         f"{shelf_position.LEDs}  is already being used by another shelf position "
                         f"in the shelf with number {shelf_position.ShelfNumber}. "
                         f"Try using another LED array.")
 
-            response.status_code, ret_str = __publish_create_update_position(shelf_position,
-                                                                             mac_address,
-                                                                             False)
+            response.status_code, ret_str = await __publish_create_update_position(
+                shelf_position, bundle.mac_address, False)
             if ret_str != "":
                 return ret_str
 
-            if response.status_code == status.HTTP_200_OK:
-                if self.data_manager.update_position(shelf, shelf_position):
+            if response.status_code == HTTP_200_OK:
+                if data_manager.update_position(bundle.shelf, shelf_position):
                     return (f"Updated position with ID {shelf_position.PositionId} on shelf with "
                             f"number {shelf_position.ShelfNumber} with LEDs {shelf_position.LEDs}.")
 
-                response.status_code = status.HTTP_406_NOT_ACCEPTABLE
+                response.status_code = HTTP_406_NOT_ACCEPTABLE
                 return (f"Received an ACK from ESP32 but couldn't add position with ID "
                         f"{shelf_position.PositionId} on shelf with number "
                         f"{shelf_position.ShelfNumber} with LEDs {shelf_position.LEDs}.")
 
-            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            log.warning("Something unexpected happened, while "
-                        "handling /light/updatePosition request.")
-            return "Something unexpected happened."
+            return __unexpected(response, "/light/updatePosition")
 
         # @self.app.put("/light/updateShelf")
         # def update_shelf(shelf_position: ShelfPosition, response: Response):
@@ -498,279 +485,238 @@ class Api:
         #    pass
 
         @self.app.delete("/light/deletePosition")
-        def delete_position(shelf_position: DeletePosition, response: Response):
+        async def delete_position(shelf_position: DeletePosition, response: Response):
             """Delete a position on a shelf."""
-            mac_address = self.data_manager.get_mac_address_by_shelf_number(
-                shelf_position.ShelfNumber
-            )
-            if mac_address is None:
-                response.status_code = status.HTTP_404_NOT_FOUND
+            bundle = data_manager.get_shelf_bundle(shelf_position.ShelfNumber)
+            if bundle is None:
+                response.status_code = HTTP_404_NOT_FOUND
                 return (f"The shelf with number {shelf_position.ShelfNumber} was not found in our "
                         f"database or check if an ESP32 has been assigned to this ShelfNumber.")
-            if not self.data_manager.position_id_exists(shelf_position.ShelfNumber,
-                                                        shelf_position.PositionId):
-                response.status_code = status.HTTP_406_NOT_ACCEPTABLE
+            shelf_position_to_be_deleted = bundle.positions.get(shelf_position.PositionId)
+            if shelf_position_to_be_deleted is None:
+                response.status_code = HTTP_406_NOT_ACCEPTABLE
                 return (
                     f"The position with ID {shelf_position.PositionId} in the shelf "
                     f"with number {shelf_position.ShelfNumber} "
                     f"doesn't exist so cannot delete position.")
-            shelf = self.data_manager.get_shelf_by_shelf_number(shelf_position.ShelfNumber)
-            response.status_code, ret_str = __validate_shelf(shelf_position, shelf)
-            if response.status_code != status.HTTP_200_OK:
-                return ret_str
 
-            shelf_position_to_be_deleted = \
-                self.data_manager.get_position_by_shelf_number_and_position_id(
-                    shelf.ShelfNumber,
-                    shelf_position.PositionId)
-            if shelf_position_to_be_deleted is None:
-                response.status_code = status.HTTP_404_NOT_FOUND
-                return (f"Didn't find position to be deleted with the position ID "
-                        f"{shelf_position.PositionId} in Shelf with the shelf_number "
-                        f"{shelf.ShelfNumber}")
-
-            list_of_int: list[int] = [shelf_position_to_be_deleted.PositionId]
-            response.status_code = self.mqtt.publish_with_ack(
-                TIMEOUT, mac_address, select_queue="config_ack",
-                topic=f"pbl/{mac_address}/config/delete_Position",
-                payload=bytearray(list_of_int)
-            )
+            message = await __publish(
+                response, bundle.mac_address, "config_ack", "config/delete_Position",
+                bytes((shelf_position_to_be_deleted.PositionId,)), route="/light/deletePosition",
+                timeout_note=". Cannot guarantee shelf position was deleted!")
+            if message is not None:
+                return message
 
-            if response.status_code == status.HTTP_504_GATEWAY_TIMEOUT:
-                return (f"Timeout warning! ESP32 with the Mac_Address {mac_address} didn't "
-                        f"respond in time. Cannot guarantee shelf position was deleted!")
-            if response.status_code == status.HTTP_200_OK:
-                if self.data_manager.delete_position(shelf, shelf_position_to_be_deleted):
-                    return (f"Deleted position with ID {shelf_position_to_be_deleted.PositionId} "
-                            f"on shelf with number {shelf_position_to_be_deleted.ShelfNumber} "
-                            f"with LEDs {shelf_position_to_be_deleted.LEDs}.")
-
-                response.status_code = status.HTTP_406_NOT_ACCEPTABLE
-                return ("Received an ACK from ESP32 but couldn't delete position "
-                        f"with ID {shelf_position_to_be_deleted.PositionId} on shelf with number "
-                        f"{shelf_position_to_be_deleted.ShelfNumber} with LEDs "
-                        f"{shelf_position_to_be_deleted.LEDs}.")
-
-            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            log.warning("Something unexpected happened, while "
-                        "handling /light/deletePosition request.")
-            return "Something unexpected happened."
+            if data_manager.delete_position(bundle.shelf, shelf_position_to_be_deleted):
+                return (f"Deleted position with ID {shelf_position_to_be_deleted.PositionId} "
+                        f"on shelf with number {shelf_position_to_be_deleted.ShelfNumber} "
+                        f"with LEDs {shelf_position_to_be_deleted.LEDs}.")
+
+            response.status_code = HTTP_406_NOT_ACCEPTABLE
+            return ("Received an ACK from ESP32 but couldn't delete position "
+                    f"with ID {shelf_position_to_be_deleted.PositionId} on shelf with number "
+                    f"{shelf_position_to_be_deleted.ShelfNumber} with LEDs "
+                    f"{shelf_position_to_be_deleted.LEDs}.")
 
         @self.app.delete("/light/deleteShelf")
-        def delete_shelf(shelf_number: ShelfSelection, response: Response):
+        async def delete_shelf(shelf_number: ShelfSelection, response: Response):
             """
             Delete the Shelf with the given shelf number. All configuration stored in
             the ESP32 assigned to the deleted Shelf will be reset.
             """
-            shelf = self.data_manager.get_shelf_by_shelf_number(shelf_number.ShelfNumber)
-            if not self.data_manager.shelf_exists(shelf_number.ShelfNumber) or shelf is None:
-                response.status_code = status.HTTP_404_NOT_FOUND
+            shelf = data_manager.get_shelf_by_shelf_number(shelf_number.ShelfNumber)
+            if shelf is None:
+                response.status_code = HTTP_404_NOT_FOUND
                 return "Cannot delete Shelf because it was not found in our database."
 
-            response.status_code = self.mqtt.publish_with_ack(
-                TIMEOUT + 20, shelf.Mac_Address,
-                select_queue="config_ack",
-                topic=f"pbl/{shelf.Mac_Address}/config/reset",
-                payload=bytearray([])
-            )
-            if response.status_code == status.HTTP_504_GATEWAY_TIMEOUT:
-                return (f"Timeout warning! ESP32 with the Mac_Address {shelf.Mac_Address} didn't "
-                        f"respond in time. Cannot guarantee shelf was deleted!")
-            if response.status_code == status.HTTP_200_OK:
-                if self.data_manager.delete_shelf_by_shelf_number(shelf.ShelfNumber):
-                    return f"Deleted shelf with shelf number {shelf.ShelfNumber}."
-
-                response.status_code = status.HTTP_406_NOT_ACCEPTABLE
-                return (f"Received an ACK from ESP32 but couldn't delete shelf with number "
-                        f"{shelf.ShelfNumber}.")
-
-            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            log.warning("Something unexpected happened, while handling /light/deleteShelf request.")
-            return "Something unexpected happened."
+            message = await __publish(response, shelf.Mac_Address, "config_ack", "config/reset",
+                                      b"", route="/light/deleteShelf", timeout=TIMEOUT + 20,
+                                      timeout_note=". Cannot guarantee shelf was deleted!")
+            if message is not None:
+                return message
+
+            if data_manager.delete_shelf_by_shelf_number(shelf.ShelfNumber):
+                return f"Deleted shelf with shelf number {shelf.ShelfNumber}."
+
+            response.status_code = HTTP_406_NOT_ACCEPTABLE
+            return (f"Received an ACK from ESP32 but couldn't delete shelf with number "
+                    f"{shelf.ShelfNumber}.")
 
         @self.app.get("/light/getPositions/{shelf_number}")
-        def get_positions(shelf_number: int, response: Response):
-            """Get all positions of a shelf."""
-            mac_address = self.data_manager.get_mac_address_by_shelf_number(shelf_number)
-            if mac_address is None:
-                response.status_code = status.HTTP_404_NOT_FOUND
+        async def get_positions(shelf_number: int, request: Request, response: Response):
+            """
+            Get all positions of a shelf. The response has an ETag header, if it is sent back
+            in If-None-Match and the database hasn't changed since, 304 is returned without a body.
+            """
+            etag = f'W/"{data_manager.get_version()}-{shelf_number}"'
+            not_modified = __not_modified(request, etag)
+            if not_modified is not None:
+                return not_modified
+
+            shelf = data_manager.get_shelf_by_shelf_number(shelf_number)
+            if shelf is None:
+                response.status_code = HTTP_404_NOT_FOUND
                 return (f"The shelf with number {shelf_number} was not found in our "
                         f"database or check if an ESP32 has been assigned to this ShelfNumber.")
-            shelf = self.data_manager.get_shelf_by_shelf_number(shelf_number)
 
-            response.status_code = status.HTTP_200_OK
-            return shelf.json()
+            # serialized like the shelves of getShelves and sent as is instead of as string
+            return Response(content=orjson.dumps(shelf.dict()), media_type="application/json",
+                            headers={"ETag": etag})
 
         @self.app.get("/light/getShelves")
-        def get_shelves(response: Response):
-            """Get all shelves."""
-            shelves = self.data_manager.get_shelf_array()
+        async def get_shelves(request: Request, response: Response):
+            """
+            Get all shelves. The response has an ETag header, if it is sent back in
+            If-None-Match and the database hasn't changed since, 304 is returned without a body.
+            """
+            # the version is read before the shelves, so the body is never older than the ETag
+            etag = f'W/"{data_manager.get_version()}"'
+            not_modified = __not_modified(request, etag)
+            if not_modified is not None:
+                return not_modified
+
+            shelves = data_manager.get_shelf_array()
             if shelves is None:
-                response.status_code = status.HTTP_404_NOT_FOUND
+                response.status_code = HTTP_404_NOT_FOUND
                 return "The ShelfArray of the DB is None or empty."
 
-            response.status_code = status.HTTP_200_OK
-            return shelves.json()
+            # Copy the list of references, so shelves added or deleted while the response is
+            # streamed do not affect it.
+            return StreamingResponse(__iter_shelves_json(list(shelves.Shelves)),
+                                     media_type="application/json", headers={"ETag": etag})
 
         @self.app.get("/light/getMACAddresses")
-        def get_mac_addresses(response: Response):
+        async def get_mac_addresses(response: Response):
             """
             Get all unused MAC-Addresses from the database
             """
-            esp32s = self.data_manager.get_esp32_array()
-            unused_mac_addresses = []
-            for esp32 in esp32s.ESP32s:
-                if not esp32.isUsed:
-                    unused_mac_addresses.append(esp32.Mac_Address)
+            unused_mac_addresses = data_manager.get_unused_mac_addresses()
             if not unused_mac_addresses:
-                response.status_code = status.HTTP_404_NOT_FOUND
+                response.status_code = HTTP_404_NOT_FOUND
                 return "Sorry, there are no unused ESP32s for your new shelf."
 
-            response.status_code = status.HTTP_200_OK
+            response.status_code = HTTP_200_OK
             return unused_mac_addresses
 
         @self.app.get("/light/getESP32")
-        def get_esp32_config(mac_address : str, shelf_number: int, response: Response):
+        async def get_esp32_config(shelf_number: int, response: Response,
+                                   mac_address: str = Query(..., regex=MAC_ADDRESS_REGEX)):
             """
             Route to get all stored data on the ESP32 with the specified MAC-address
             into the shelf with the specified shelf number. This route prepares an empty shelf that
             will sequentially receive all the sent positions from the ESP32.
             In order to use this route you have to:
-            -send an existing MAC-address
+            -send an existing MAC-address (malformed MAC-addresses are rejected with 422)
             -the MAC-address has to be assigned to the given shelf number
             -or the shelf number is a new one but the MAC-address is not assigned to another shelf
             """
-            if not self.data_manager.mac_address_exists(mac_address):
-                response.status_code = status.HTTP_404_NOT_FOUND
+            esp32 = data_manager.get_esp32_by_mac_address(mac_address)
+            if esp32 is None:
+                response.status_code = HTTP_404_NOT_FOUND
                 return (f"Cannot get data from ESP32 with MAC-address "
                         f"{mac_address} because it was "
                         f"not found in our database.")
 
-            esp32 = self.data_manager.get_esp32_by_mac_address(mac_address)
-
-            if mac_address == self.data_manager.get_mac_address_by_shelf_number(shelf_number):
-                if self.data_manager.delete_shelf_by_shelf_number(shelf_number):
-                    if self.data_manager.add_shelf(
-                            Shelf(ShelfNumber=shelf_number,
-                                  Mac_Address=mac_address,
-                                  Positions=[])):
-                        response.status_code = self.mqtt.publish_with_ack(
-                            TIMEOUT, mac_address,
-                            select_queue="config_ack",
-                            topic=f"pbl/{mac_address}/config/get",
-                            payload=bytearray([])
-                        )
-                        if response.status_code == status.HTTP_504_GATEWAY_TIMEOUT:
-                            return (f"Timeout warning! ESP32 with the Mac_Address "
-                                    f"{mac_address} didn't respond in time "
-                                    f"or during the reset process a timeout occurred. It is not "
-                                    f"guaranteed that all positions were reset on the ESP32.")
-                        if response.status_code == status.HTTP_200_OK:
-                            return (f"Sent get message to ESP32 with MAC-address "
-                                    f"{mac_address}")
-                    response.status_code = status.HTTP_400_BAD_REQUEST
-                    return (f"Deleted existing shelf with shelf number "
-                            f"{shelf_number} but couldn't create a new one "
-                            f"with the shelf number {shelf_number} and the "
-                            f"MAC-address {mac_address} in order to put the "
-                            f"sent data into it. Try it again.")
-
-            if not self.data_manager.shelf_exists(shelf_number):
-                if esp32.isUsed:
-                    esp32.isUsed = False
-                if self.data_manager.add_shelf(
-                        Shelf(ShelfNumber=shelf_number,
-                              Mac_Address=mac_address,
-                              Positions=[])):
-                    response.status_code = self.mqtt.publish_with_ack(
-                        TIMEOUT, mac_address,
-                        select_queue="config_ack",
-                        topic=f"pbl/{mac_address}/config/get",
-                        payload=bytearray([])
-                    )
-                    if response.status_code == status.HTTP_504_GATEWAY_TIMEOUT:
-                        return (f"Timeout warning! ESP32 with the Mac_Address "
-                                f"{mac_address} didn't respond in time. A "
-                                f"new shelf was created but it is not guaranteed that all "
-                                f"positions were gotten from the ESP32.")
-                    if response.status_code == status.HTTP_200_OK:
-                        return (f"Sent get message to ESP32 with MAC-address "
-                                f"{mac_address}")
-                if not esp32.isUsed:
-                    esp32.isUsed = True
-                response.status_code = status.HTTP_400_BAD_REQUEST
+            shelf = data_manager.get_shelf_by_shelf_number(shelf_number)
+            if shelf is not None and shelf.Mac_Address != mac_address:
+                response.status_code = HTTP_400_BAD_REQUEST
                 return (f"Couldn't send get message to ESP32 with MAC-address "
-                        f"{mac_address} because couldn't add a shelf that "
-                        f"would receive the put data.")
-            response.status_code = status.HTTP_400_BAD_REQUEST
-            mac_address = self.data_manager.get_mac_address_by_shelf_number(shelf_number)
-            return (f"Couldn't send get message to ESP32 with MAC-address "
-                    f"{mac_address} because tried to get data from an ESP32 "
-                    f"that is assigned to another shelf. The shelf with the number "
-                    f"{shelf_number} is assigned to the ESP32 with the MAC "
-                    f"{mac_address}")
+                        f"{mac_address} because tried to get data from an ESP32 "
+                        f"that is assigned to another shelf. The shelf with the number "
+                        f"{shelf_number} is assigned to the ESP32 with the MAC "
+                        f"{shelf.Mac_Address}")
+
+            # the positions sent by the ESP32 are put into an empty shelf
+            if shelf is not None:
+                if not data_manager.clear_positions(shelf):
+                    response.status_code = HTTP_400_BAD_REQUEST
+                    return (f"Couldn't clear the positions of the shelf with shelf number "
+                            f"{shelf_number} in order to put the sent data into it. "
+                            f"Try it again.")
+            else:
+                # marking the ESP32 unused, adding the shelf and the rollback are written at once
+                with data_manager.batch():
+                    was_used = esp32.isUsed
+                    data_manager.mark_unused(esp32)
+                    # both values were already validated by FastAPI, so pydantic doesn't have to
+                    added = data_manager.add_shelf(Shelf.construct(ShelfNumber=shelf_number,
+                                                                   Mac_Address=mac_address,
+                                                                   Positions=[]))
+                    if not added and was_used:
+                        data_manager.mark_used(esp32)
+                if not added:
+                    response.status_code = HTTP_400_BAD_REQUEST
+                    return (f"Couldn't send get message to ESP32 with MAC-address "
+                            f"{mac_address} because couldn't add a shelf that "
+                            f"would receive the put data.")
+
+            message = await __publish(
+                response, mac_address, "config_ack", "config/get", b"", route="/light/getESP32",
+                timeout_note=". It is not guaranteed that all positions were gotten from the ESP32.")
+            if message is not None:
+                return message
+
+            return f"Sent get message to ESP32 with MAC-address {mac_address}"
 
         @self.app.post("/light/resetESP32")
-        def reset_esp32(esp32_to_be_reset: ResetESP32, response: Response):
+        async def reset_esp32(esp32_to_be_reset: ResetESP32, response: Response):
             """
             Route to reset the stored data on the ESP32 with the specified
             MAC-Address in the post body.
             """
-            response.status_code = self.mqtt.publish_with_ack(
-                TIMEOUT + 20, esp32_to_be_reset.Mac_Address,
-                select_queue="config_ack",
-                topic=f"pbl/{esp32_to_be_reset.Mac_Address}/config/reset",
-                payload=bytearray([])
-            )
-            if response.status_code == status.HTTP_504_GATEWAY_TIMEOUT:
-                return (f"Timeout warning! ESP32 with the Mac_Address "
-                        f"{esp32_to_be_reset.Mac_Address} didn't respond in time or during the "
-                        f"reset process a timeout occurred. It is not guaranteed that all "
-                        f"positions were reset on the ESP32.")
-            if response.status_code == status.HTTP_200_OK:
-                return f"Reset all positions on ESP32 with address {esp32_to_be_reset.Mac_Address}"
-
-            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            log.warning("Something unexpected happened, while handling /light/resetESP32 request.")
-            return "Something unexpected happened."
+            if not data_manager.mac_address_exists(esp32_to_be_reset.Mac_Address):
+                response.status_code = HTTP_404_NOT_FOUND
+                return (f"The ESP32 with the MAC-Address {esp32_to_be_reset.Mac_Address} "
+                        f"was not found in our database.")
+            message = await __publish(
+                response, esp32_to_be_reset.Mac_Address, "config_ack", "config/reset", b"",
+                route="/light/resetESP32", timeout=TIMEOUT + 20,
+                timeout_note=(" or during the reset process a timeout occurred. It is not "
+                              "guaranteed that all positions were reset on the ESP32."))
+            if message is not None:
+                return message
+
+            return f"Reset all positions on ESP32 with address {esp32_to_be_reset.Mac_Address}"
 
         @self.app.post("/light/loadESP32")
-        def load_esp32(shelf_number: ShelfSelection, response: Response):
+        async def load_esp32(shelf_number: ShelfSelection, response: Response):
             """
             Route to load the entire content of a shelf with the given shelf_number
-            to the ESP32 assigned to it.
+            to the ESP32 assigned to it. Up to LOAD_WINDOW positions are sent before
+            their ACKs have arrived, instead of waiting for each ACK in turn.
             """
-            mac_address = self.data_manager.get_mac_address_by_shelf_number(
-                shelf_number.ShelfNumber
-            )
-            if mac_address is None:
-                response.status_code = status.HTTP_404_NOT_FOUND
+            shelf = data_manager.get_shelf_by_shelf_number(shelf_number.ShelfNumber)
+            if shelf is None:
+                response.status_code = HTTP_404_NOT_FOUND
                 return (f"The shelf with number {shelf_number.ShelfNumber} was not found in our "
                         f"database or check if an ESP32 has been assigned to this ShelfNumber.")
-            positions = self.data_manager.get_positions_by_shelf_number(shelf_number.ShelfNumber)
-            response.status_code = 200
-            timeout_happened = False
-            log.debug("Before starting loading process, time = %s", str(datetime.datetime.now()))
-            for position in positions:
-                list_of_int: list[int] = [position.PositionId]
-                list_of_int.extend(position.LEDs)
-                response.status_code = self.mqtt.publish_with_ack(
-                    TIMEOUT, mac_address, select_queue="config_ack",
-                    topic=f"pbl/{mac_address}/config/update_Position",
-                    payload=bytearray(list_of_int)
-                )
-                if response.status_code == status.HTTP_504_GATEWAY_TIMEOUT:
-                    timeout_happened = True
-
-            log.debug("After loading process, time = %s", str(datetime.datetime.now()))
-
-            if response.status_code == status.HTTP_504_GATEWAY_TIMEOUT or timeout_happened:
+            mac_address = shelf.Mac_Address
+            if mqtt.is_unresponsive(mac_address):
+                response.status_code = HTTP_504_GATEWAY_TIMEOUT
+                return __unresponsive_message(mac_address)
+            positions = shelf.Positions
+            topic = get_topics(mac_address)["config/update_Position"]
+            window = asyncio.Semaphore(LOAD_WINDOW)
+
+            async def load_position(position: ShelfPosition) -> int:
+                async with window:
+                    return await mqtt.publish_with_ack_async(
+                        TIMEOUT, mac_address, select_queue="config_ack", topic=topic,
+                        payload=bytes((position.PositionId, *position.LEDs))
+                    )
+
+            log.debug("Before starting loading process, time = %s", datetime.datetime.now())
+            status_codes = await asyncio.gather(*(load_position(position)
+                                                  for position in positions))
+            log.debug("After loading process, time = %s", datetime.datetime.now())
+
+            if HTTP_504_GATEWAY_TIMEOUT in status_codes:
+                response.status_code = HTTP_504_GATEWAY_TIMEOUT
                 return (f"Timeout warning! ESP32 with the Mac_Address {mac_address} didn't "
                         f"respond in time or during the loading process a timeout occurred. It "
                         f"is not guaranteed that all positions were loaded to the ESP32.")
-            if response.status_code == status.HTTP_200_OK:
+            if all(status_code == HTTP_200_OK for status_code in status_codes):
+                response.status_code = HTTP_200_OK
                 return f"Loaded all positions to ESP32 with address {mac_address}"
 
-            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            log.warning("Something unexpected happened, while handling /light/loadESP32 request.")
-            return "Something unexpected happened."
+            return __unexpected(response, "/light/loadESP32")
@@ -1,17 +1,50 @@
 """Submodule that manages the JSON database containing Shelves and ESP32s."""
 
-import datetime
-import json
+from contextlib import contextmanager
+import os
+import shutil
+import threading
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set
 from logging import getLogger
 
+import orjson
+
 from HttpToMqtt.Types import *
 
+# seconds changes are collected before the database is written to its JSON file
+SAVE_DELAY = 1
+
 log = getLogger(__name__)
 
 
-class DataManager:
+class ShelfBundle(NamedTuple):
+    """
+    Everything the API needs to validate a request on a Shelf, gathered in one pass.
+
+    Attributes
+    ----------
+    mac_address : str
+        MAC-address of the ESP32 assigned to the Shelf.
+    shelf : Shelf
+        The Shelf object stored in the database.
+    positions : Dict[int, ShelfPosition]
+        All ShelfPositions of the Shelf keyed by their PositionId.
+    leds : Dict[int, int]
+        All LEDs used by any ShelfPosition of the Shelf mapped to the PositionId using them.
+
+    positions and leds are the indexes the DataManager keeps up to date internally,
+    so they must not be modified.
+    """
+
+    mac_address: str
+    shelf: Shelf
+    positions: Dict[int, ShelfPosition]
+    leds: Dict[int, int]
+
+
+class DataManager:  # pylint: disable=too-many-public-methods, too-many-instance-attributes
     """
     A class that manages a JSON database that complies to
     the structure of the Class DB in Types/__init__.py.
@@ -30,6 +63,48 @@ class DataManager:
         has to be stored.
     __path_to_json_file_backup : Path
         String with the path to the JSON file that holds a backup of the database.
+    __shelves : Dict[int, Shelf]
+        Index of all Shelves in the database keyed by their ShelfNumber.
+    __shelves_by_mac_address : Dict[str, Shelf]
+        Index of all Shelves in the database keyed by the MAC-address of their ESP32.
+    __esp32s : Dict[str, ESP32]
+        Index of all ESP32s in the database keyed by their MAC-address.
+    __positions : Dict[int, Dict[int, ShelfPosition]]
+        ShelfPositions of every Shelf keyed by their PositionId, keyed by the ShelfNumber
+        of their Shelf.
+    __leds : Dict[int, Dict[int, int]]
+        LEDs of all ShelfPositions mapped to the PositionId using them, keyed by the
+        ShelfNumber of their Shelf.
+    __unused_mac_addresses : Dict[str, None]
+        MAC-addresses of all ESP32s whose attribute isUsed is False, used as an ordered set.
+    __version : int
+        Number that grows every time the database is saved. It starts at the time of loading
+        in nanoseconds, so versions of different runs don't collide.
+    __shelf_json : Dict[int, bytes]
+        Serialized JSON of every Shelf keyed by its ShelfNumber, as it is written to the JSON
+        file. Only Shelves that have changed since the last save are serialized again.
+    __changed_shelves : Set[int]
+        ShelfNumbers of the Shelves whose entry in __shelf_json is outdated.
+    __dirty : bool
+        True if the database has changed since it was last written to its JSON file.
+    __save_lock : threading.Condition
+        Lock guarding __dirty, __batch_depth and __closed. The writer thread waits on it
+        for unsaved changes.
+    __write_lock : threading.RLock
+        Lock serializing the writing of the JSON file and its backup.
+    __writer : threading.Thread
+        Daemon thread that writes the database SAVE_DELAY seconds after the first unsaved
+        change, so the threads changing the database never wait for the disk.
+    __closed : bool
+        True once close has been called. The writer thread stops then.
+    __batch_depth : int
+        Number of batch blocks currently entered. While it is above 0 no save is scheduled.
+    __backup_pending : bool
+        True until the JSON file is written for the first time. Before that the JSON file
+        as it was when the DataManager was constructed is copied to the backup file.
+    __written_json : Optional[bytes]
+        Content of the JSON file as it was last read or written. A save that would write
+        the same content again is skipped.
     """
 
     def __init__(self, path_to_json_file: Path):
@@ -51,50 +126,249 @@ class DataManager:
         If the specified path does not end with '.json' then an exception is raised.
         """
         if path_to_json_file.name.endswith('.json'):
+            self.__version = time.time_ns()
+            self.__dirty = False
+            self.__save_lock = threading.Condition(threading.Lock())
+            self.__write_lock = threading.RLock()
+            self.__closed = False
+            self.__batch_depth = 0
+            self.__backup_pending = True
+            self.__written_json = None
             try:
                 self.__path_to_json_file = path_to_json_file
-                parts = path_to_json_file.parts
-                self.__path_to_json_file_backup = Path(*(*parts[:-1],
-                                                         parts[-1].replace(".json", "_backup.json"))
-                                                       )
-                log.debug("self.__path_to_json_file = %s", str(self.__path_to_json_file))
+                self.__path_to_json_file_backup = path_to_json_file.with_name(
+                    path_to_json_file.stem + "_backup.json")
+                log.debug("self.__path_to_json_file = %s", self.__path_to_json_file)
                 # creating the database out of the json file.
                 log.debug("self.__path_to_json_file_backup = %s",
-                          str(self.__path_to_json_file_backup))
-                self.__db = DB.parse_file(path_to_json_file)
-                self.set_all_esp32s_offline()
+                          self.__path_to_json_file_backup)
+                with open(path_to_json_file, "rb") as file:
+                    self.__written_json = file.read()
+                self.__db = DB.parse_obj(orjson.loads(self.__written_json))
+                self.__build_indexes()
+                # the file is only rewritten if loading it changed anything
+                if self.set_all_esp32s_offline():
+                    self.save_data()
+                    self.flush()
                 log.info("Initialized DB successfully with path %s", self.__path_to_json_file)
-                self.save_data()
-                self.save_backup_data()
             except FileNotFoundError:
                 self.__db = DB(Shelves=[], ESP32s=[])
+                self.__build_indexes()
                 log.info("Couldn't find json file. Initialized DB successfully with empty database.")
                 self.save_data()
-                self.save_backup_data()
+                self.flush()
+            self.__writer = threading.Thread(target=self.__write_loop,
+                                             name="DataManager-writer", daemon=True)
+            self.__writer.start()
 
         else:
             raise Exception("The given path name doesn't end with .json! Use a valid .json file!")
 
+    def __build_indexes(self) -> None:
+        """
+        Build the lookup indexes out of the Shelves and ESP32s stored in the database.
+        """
+        self.__shelves: Dict[int, Shelf] = {}
+        self.__shelves_by_mac_address: Dict[str, Shelf] = {}
+        self.__esp32s: Dict[str, ESP32] = {}
+        self.__positions: Dict[int, Dict[int, ShelfPosition]] = {}
+        self.__leds: Dict[int, Dict[int, int]] = {}
+        self.__unused_mac_addresses: Dict[str, None] = {}
+        self.__shelf_json: Dict[int, bytes] = {}
+        self.__changed_shelves: Set[int] = set()
+        for shelf in self.__db.Shelves.Shelves:
+            self.__index_shelf(shelf)
+        for esp32 in self.__db.ESP32s.ESP32s:
+            self.__esp32s.setdefault(esp32.Mac_Address, esp32)
+            if not esp32.isUsed:
+                self.__unused_mac_addresses[esp32.Mac_Address] = None
+
+    def __index_shelf(self, shelf: Shelf) -> None:
+        """
+        Add the given Shelf and its ShelfPositions to the lookup indexes.
+        """
+        self.__shelves.setdefault(shelf.ShelfNumber, shelf)
+        self.__shelves_by_mac_address.setdefault(shelf.Mac_Address, shelf)
+        positions: Dict[int, ShelfPosition] = {}
+        leds: Dict[int, int] = {}
+        add_position = positions.setdefault
+        add_led = leds.setdefault
+        for position in shelf.Positions:
+            position_id = position.PositionId
+            add_position(position_id, position)
+            for led in position.LEDs:
+                add_led(led, position_id)
+        self.__positions[shelf.ShelfNumber] = positions
+        self.__leds[shelf.ShelfNumber] = leds
+        self.__changed_shelves.add(shelf.ShelfNumber)
+
+    def __unindex_shelf(self, shelf: Shelf) -> None:
+        """
+        Remove the given Shelf from the lookup indexes.
+        """
+        del self.__shelves[shelf.ShelfNumber]
+        del self.__positions[shelf.ShelfNumber]
+        del self.__leds[shelf.ShelfNumber]
+        self.__changed_shelves.add(shelf.ShelfNumber)
+        if self.__shelves_by_mac_address.get(shelf.Mac_Address) is shelf:
+            del self.__shelves_by_mac_address[shelf.Mac_Address]
+            # another Shelf might have been assigned to the same ESP32
+            for other_shelf in self.__db.Shelves.Shelves:
+                if other_shelf.Mac_Address == shelf.Mac_Address:
+                    self.__shelves_by_mac_address[shelf.Mac_Address] = other_shelf
+                    break
+
+    @staticmethod
+    def __unindex_leds(used_leds: Dict[int, int], shelf_position: ShelfPosition) -> None:
+        """
+        Remove the LEDs of the given ShelfPosition from the LED index of its Shelf.
+        """
+        for led in shelf_position.LEDs:
+            if used_leds.get(led) == shelf_position.PositionId:
+                del used_leds[led]
+
+    def __serialize_db(self) -> bytes:
+        """
+        Serialize the database to the same JSON orjson.dumps(db.dict(), option=OPT_INDENT_2)
+        returns, reusing the JSON of every Shelf that hasn't changed since the last call.
+        """
+        # the ShelfNumbers are popped only after the Shelves have been changed, so a change
+        # happening while serializing is picked up by the next call at the latest
+        while self.__changed_shelves:
+            self.__shelf_json.pop(self.__changed_shelves.pop(), None)
+
+        shelves_json = []
+        append = shelves_json.append
+        indexed_shelves = self.__shelves
+        cache = self.__shelf_json
+        dump_shelf = self.__dump_shelf
+        for shelf in self.__db.Shelves.Shelves:
+            shelf_number = shelf.ShelfNumber
+            if indexed_shelves.get(shelf_number) is not shelf:
+                # a second Shelf with the same ShelfNumber isn't indexed, so it isn't cached
+                append(dump_shelf(shelf))
+                continue
+            shelf_json = cache.get(shelf_number)
+            if shelf_json is None:
+                shelf_json = cache[shelf_number] = dump_shelf(shelf)
+            append(shelf_json)
+
+        if shelves_json:
+            shelves = b'[\n      ' + b',\n      '.join(shelves_json) + b'\n    ]'
+        else:
+            shelves = b'[]'
+        esp32s = orjson.dumps(self.__db.ESP32s.dict(), option=orjson.OPT_INDENT_2)
+        return (b'{\n  "Shelves": {\n    "Shelves": ' + shelves + b'\n  },\n  "ESP32s": '
+                + esp32s.replace(b'\n', b'\n  ') + b'\n}')
+
+    @staticmethod
+    def __dump_shelf(shelf: Shelf) -> bytes:
+        """
+        Serialize the given Shelf indented to its depth in the JSON file.
+        """
+        return orjson.dumps(shelf.dict(), option=orjson.OPT_INDENT_2).replace(b'\n', b'\n      ')
+
     def __save_data_to(self, path):
         """
         Save the data stored in the DB object from the DataManager as JSON to path.
+        The JSON is indented with 2 spaces, the only indentation orjson supports.
+        It is written to a temporary file first that replaces the file in path once it is
+        on disk, so a crash while saving never leaves a partially written database behind.
+        If the JSON is the same as the one last read or written, nothing is written.
         """
-        log.debug("Before file.write() time = %s", str(datetime.datetime.now()))
-        with open(path, "wt", encoding="utf-8") as file:
-            file.write(json.dumps(json.loads(self.__db.json()), indent=4))
-        log.debug("After file.write() time = %s", str(datetime.datetime.now()))
+        started = time.perf_counter()
+        payload = self.__serialize_db()
+        if payload == self.__written_json:
+            log.debug("Database is unchanged, skipped writing it.")
+            return
+        temporary_path = path.with_name(path.name + ".tmp")
+        with open(temporary_path, "wb") as file:
+            file.write(payload)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, path)
+        self.__written_json = payload
+        log.debug("Saved database to %s in %.1f ms.", path, (time.perf_counter() - started) * 1000)
 
     def save_data(self) -> None:
         """
         Saves the data stored in the DB object from the DataManager as JSON in a text file.
+        Every change of the database is followed by a call of this method, so it also
+        increments the version returned by get_version.
+        The file is not written by the calling thread but by a writer thread SAVE_DELAY
+        seconds after the first unsaved change, so a burst of changes results in a single
+        write. Call flush to write it immediately.
         """
-        self.__save_data_to(self.__path_to_json_file)
+        with self.__save_lock:
+            self.__version += 1
+            self.__dirty = True
+            if self.__batch_depth == 0:
+                self.__save_lock.notify()
 
-    def save_backup_data(self) -> None:
+    def __write_loop(self) -> None:
+        """
+        Loop of the writer thread. Waits for unsaved changes, collects further changes for
+        SAVE_DELAY seconds and writes them, until close is called.
+        """
+        while True:
+            with self.__save_lock:
+                self.__save_lock.wait_for(lambda: self.__closed or
+                                          (self.__dirty and self.__batch_depth == 0))
+                if self.__closed:
+                    return
+                self.__save_lock.wait_for(lambda: self.__closed, timeout=SAVE_DELAY)
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes all unsaved changes of the database to its JSON file immediately.
+        """
+        with self.__write_lock:
+            with self.__save_lock:
+                if not self.__dirty:
+                    return
+                self.__dirty = False
+            if self.__backup_pending:
+                self.__backup_pending = False
+                if self.__path_to_json_file.exists():
+                    shutil.copyfile(self.__path_to_json_file, self.__path_to_json_file_backup)
+            self.__save_data_to(self.__path_to_json_file)
+
+    def close(self) -> None:
+        """
+        Stops the writer thread and writes all unsaved changes of the database to its
+        JSON file. Has to be called before shutting down, otherwise the changes of the
+        last SAVE_DELAY seconds are lost.
         """
-        Saves a backup of the data stored in the DB object from the DataManager as JSON in a text file.
+        with self.__save_lock:
+            self.__closed = True
+            self.__save_lock.notify_all()
+        self.__writer.join()
+        self.flush()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
         """
-        self.__save_data_to(self.__path_to_json_file_backup)
+        Context manager for making several changes to the database at once. No save is
+        scheduled until the outermost batch block is left, then all changes are written
+        with a single write.
+
+        Example
+        -------
+        with data_manager.batch():
+            for shelf_position in shelf_positions:
+                data_manager.add_position(shelf, shelf_position)
+        """
+        with self.__save_lock:
+            self.__batch_depth += 1
+        try:
+            yield
+        finally:
+            with self.__save_lock:
+                self.__batch_depth -= 1
+                done = self.__batch_depth == 0
+            if done:
+                self.flush()
 
     def shelf_exists(self, shelf_number: int) -> bool:
         """
@@ -110,14 +384,9 @@ class DataManager:
             True if the given shelf_number is found in the JSON database file.
             False if the given shelf_number is not found in the JSON database file.
         """
-        result = False
-        for shelf in self.__db.Shelves.Shelves:
-            if shelf_number == shelf.ShelfNumber:
-                result = True
-                return result
-        return result
+        return shelf_number in self.__shelves
 
-    def shelf_exists_by_mac_address(self, mac_address: str):
+    def shelf_exists_by_mac_address(self, mac_address: str) -> bool:
         """
         Returns True if the given MAC-address is found in a Shelf in the database.
 
@@ -131,12 +400,7 @@ class DataManager:
         True if the given MAC-address is found in a Shelf in the database.
         False if the given MAC-address is not found in a Shelf in the database.
         """
-        result = False
-        shelves = self.get_shelf_array().Shelves
-        for shelf in shelves:
-            if shelf.Mac_Address == mac_address:
-                result = True
-        return result
+        return mac_address in self.__shelves_by_mac_address
 
     def mac_address_exists(self, mac_address: str) -> bool:
         """
@@ -152,12 +416,7 @@ class DataManager:
         True if the given MAC-address is found in the database.
         False if the given MAC-address is not found in the database.
         """
-        result = False
-        for esp32 in self.__db.ESP32s.ESP32s:
-            if mac_address == esp32.Mac_Address:
-                result = True
-                return result
-        return result
+        return mac_address in self.__esp32s
 
     def position_id_exists(self, shelf_number: int, position_id: int) -> bool:
         """
@@ -177,17 +436,11 @@ class DataManager:
         False if the given ShelfNumber is not found in the database
         or the Shelf does not store the given PositionId.
         """
-        result = False
-        if not self.shelf_exists(shelf_number):
+        positions = self.__positions.get(shelf_number)
+        if positions is None:
             log.debug("ShelfNumber was not found!")
-            return result
-        for shelf in self.__db.Shelves.Shelves:
-            if shelf.ShelfNumber == shelf_number:
-                for position in shelf.Positions:
-                    if position.PositionId == position_id:
-                        result = True
-                        return result
-        return result
+            return False
+        return position_id in positions
 
     def leds_exists(self, leds: List[int], shelf_number: int) -> bool:
         """
@@ -209,24 +462,16 @@ class DataManager:
         Returns False when no LEDs are found in other ShelfPositions in the database.
         """
 
-        result = False
-        if not self.shelf_exists(shelf_number):
+        used_leds = self.__leds.get(shelf_number)
+        if used_leds is None:
             log.debug("ShelfNumber was not found!")
-            return result
-        positions = self.get_positions_by_shelf_number(shelf_number)
-        if positions is None or not positions:
-            log.debug("Shelf positions from the shelf "
-                      "with the given shelf number is empty or None.")
-            return result
-        for position in positions:
-            for led in leds:
-                if led in position.LEDs:
-                    log.warning("One of the given LEDs is equal to an existing one in the position "
-                                "with the id %d in the Shelf with the number %d",
-                                position.PositionId, position.ShelfNumber)
-                    result = True
-                    return result
-        return result
+            return False
+        for led in leds:
+            if led in used_leds:
+                log.warning("The given LED %d is equal to an existing one in the Shelf "
+                            "with the number %d", led, shelf_number)
+                return True
+        return False
 
     def leds_exists_exclusive(self, shelf_position: ShelfPosition) -> bool:
         """
@@ -248,30 +493,23 @@ class DataManager:
         in other ShelfPositions in the Shelf with the ShelfNumber of the given ShelfPosition.
         """
 
-        result = False
-        if not self.shelf_exists(shelf_position.ShelfNumber):
+        positions = self.__positions.get(shelf_position.ShelfNumber)
+        if positions is None:
             log.debug("ShelfNumber was not found!")
-            return result
-        if not self.position_id_exists(shelf_position.ShelfNumber, shelf_position.PositionId):
+            return False
+        position_id = shelf_position.PositionId
+        if position_id not in positions:
             log.debug("Position with the given position_id %d doesn't exist so cannot execute "
-                      "method leds_exists_exclusive.", shelf_position.PositionId)
-            return result
-        positions = self.get_positions_by_shelf_number(shelf_position.ShelfNumber)
-        if positions is None or not positions:
-            log.debug("Shelf positions from the shelf with "
-                      "the given shelf number is empty or None.")
-            return result
-        for position in positions:
-            if position.PositionId == shelf_position.PositionId:
-                continue
-            for led in shelf_position.LEDs:
-                if led in position.LEDs:
-                    log.warning("Cannot add ShelfPosition because one of the given LEDs is equal "
-                                "to an existing one in the position with the id %d in the Shelf "
-                                "with the number %d", position.PositionId, position.ShelfNumber)
-                    result = True
-                    return result
-        return result
+                      "method leds_exists_exclusive.", position_id)
+            return False
+        used_leds = self.__leds[shelf_position.ShelfNumber]
+        for led in shelf_position.LEDs:
+            if used_leds.get(led, position_id) != position_id:
+                log.warning("Cannot add ShelfPosition because the given LED %d is equal to an "
+                            "existing one in another position in the Shelf with the number %d",
+                            led, shelf_position.ShelfNumber)
+                return True
+        return False
 
     def get_shelf_by_shelf_number(self, shelf_number: int) -> Optional[Shelf]:
         """
@@ -287,14 +525,9 @@ class DataManager:
         A Shelf object if the given ShelfNumber is found in the database.
         None if the given ShelfNumber is not found in the database.
         """
-        result = None
-        if not self.shelf_exists(shelf_number):
+        result = self.__shelves.get(shelf_number)
+        if result is None:
             log.debug("ShelfNumber was not found!")
-            return result
-        for shelf in self.__db.Shelves.Shelves:
-            if shelf.ShelfNumber == shelf_number:
-                result = shelf
-                return result
         return result
 
     def get_shelf_by_mac_address(self, mac_address: str) -> Optional[Shelf]:
@@ -311,16 +544,79 @@ class DataManager:
         A Shelf object if the given MAC-address is found in the database.
         None if the given MAC-address is not found in the database.
         """
-        result = None
-        if not self.shelf_exists_by_mac_address(mac_address):
+        result = self.__shelves_by_mac_address.get(mac_address)
+        if result is None:
             log.debug("ShelfNumber was not found!")
-            return result
-        for shelf in self.__db.Shelves.Shelves:
-            if shelf.Mac_Address == mac_address:
-                result = shelf
-                return result
         return result
 
+    def get_unused_mac_addresses(self) -> List[str]:
+        """
+        Method to get the MAC-addresses of all ESP32s that are not assigned to a Shelf.
+        """
+        return list(self.__unused_mac_addresses)
+
+    def mark_used(self, esp32: ESP32) -> None:
+        """
+        Sets the attribute isUsed of the given ESP32 to True. isUsed must not be set
+        directly, otherwise get_unused_mac_addresses gets out of sync.
+
+        Parameters
+        -------
+        esp32 : ESP32
+        ESP32 object stored in the database.
+        """
+        esp32.isUsed = True
+        self.__unused_mac_addresses.pop(esp32.Mac_Address, None)
+
+    def mark_unused(self, esp32: ESP32) -> None:
+        """
+        Sets the attribute isUsed of the given ESP32 to False. isUsed must not be set
+        directly, otherwise get_unused_mac_addresses gets out of sync.
+
+        Parameters
+        -------
+        esp32 : ESP32
+        ESP32 object stored in the database.
+        """
+        esp32.isUsed = False
+        self.__unused_mac_addresses[esp32.Mac_Address] = None
+
+    def get_version(self) -> int:
+        """
+        Method to get the current version of the database. The version changes whenever
+        the database is changed, so it can be used to tell if data sent before is still
+        up to date.
+
+        Returns
+        -------
+        The current version of the database.
+        """
+        return self.__version
+
+    def get_shelf_bundle(self, shelf_number: int) -> Optional[ShelfBundle]:
+        """
+        Method to get the Shelf with the given ShelfNumber together with its MAC-address,
+        its ShelfPositions keyed by PositionId and all LEDs in use mapped to their PositionId,
+        walking the database only once. The positions and LEDs are the internal indexes,
+        so they must not be modified.
+
+        Parameters
+        -------
+        shelf_number: int
+        The ShelfNumber to search for in the database.
+
+        Returns
+        -------
+        A ShelfBundle if the given ShelfNumber is found in the database.
+        None if the given ShelfNumber is not found in the database.
+        """
+        shelf = self.__shelves.get(shelf_number)
+        if shelf is None:
+            log.debug("ShelfNumber was not found!")
+            return None
+        return ShelfBundle(shelf.Mac_Address, shelf, self.__positions[shelf_number],
+                           self.__leds[shelf_number])
+
     def get_shelf_array(self) -> ShelfArray:
         """
         Method to get the ShelfArray object from the DataManager.
@@ -347,15 +643,11 @@ class DataManager:
         A MAC-address if the given ShelfNumber is found in the database.
         None if the given ShelfNumber is not found in the database.
         """
-        result = None
-        if not self.shelf_exists(shelf_number):
+        shelf = self.__shelves.get(shelf_number)
+        if shelf is None:
             log.debug("ShelfNumber was not found!")
-            return result
-        for shelf in self.__db.Shelves.Shelves:
-            if shelf.ShelfNumber == shelf_number:
-                result = shelf.Mac_Address
-                return result
-        return result
+            return None
+        return shelf.Mac_Address
 
     def get_position_by_shelf_number_and_position_id(self, shelf_number: int, position_id: int
                                                      ) -> Optional[ShelfPosition]:
@@ -375,15 +667,11 @@ class DataManager:
         database file.
         None if the given ShelfNumber or the PositionId is not found in the JSON database file.
         """
-        result = None
-        if not self.shelf_exists(shelf_number):
+        positions = self.__positions.get(shelf_number)
+        if positions is None:
             log.debug("ShelfNumber was not found!")
-            return result
-        for position in self.get_shelf_by_shelf_number(shelf_number).Positions:
-            if position.PositionId == position_id:
-                result = position
-                return result
-        return result
+            return None
+        return positions.get(position_id)
 
     def get_positions_by_shelf_number(self, shelf_number: int) -> Optional[List[ShelfPosition]]:
         """
@@ -399,13 +687,11 @@ class DataManager:
         A List[ShelfPosition] object if the given ShelfNumber is found in the database.
         None if the given ShelfNumber is not found in the database.
         """
-        result = None
-        if not self.shelf_exists(shelf_number):
+        shelf = self.__shelves.get(shelf_number)
+        if shelf is None:
             log.debug("ShelfNumber was not found!")
-            return result
-        result = self.get_shelf_by_shelf_number(shelf_number).Positions
-
-        return result
+            return None
+        return shelf.Positions
 
     def get_leds_by_shelf_number_and_position_id(self, shelf_number: int, position_id: int
                                                  ) -> Optional[List[int]]:
@@ -426,20 +712,11 @@ class DataManager:
         its ShelfNumber and at the given PositionId if found in the database.
         None if the given ShelfNumber or the PositionId is not found in the database.
         """
-        result = None
-        if not self.shelf_exists(shelf_number):
-            log.debug("ShelfNumber was not found!")
-            return result
-        if not self.position_id_exists(shelf_number, position_id):
+        position = self.get_position_by_shelf_number_and_position_id(shelf_number, position_id)
+        if position is None:
             log.debug("PositionId was not found!")
-            return result
-        for shelf in self.__db.Shelves.Shelves:
-            if shelf.ShelfNumber == shelf_number:
-                for position in shelf.Positions:
-                    if position.PositionId == position_id:
-                        result = position.LEDs
-                        return result
-        return result
+            return None
+        return position.LEDs
 
     def get_esp32_by_mac_address(self, mac_address: str) -> Optional[ESP32]:
         """
@@ -456,14 +733,9 @@ class DataManager:
         An ESP32 object if the given MAC-address is found in the database.
         None if an ESP32 object with the given MAC-address is not found in the database.
         """
-        result = None
-        if not self.mac_address_exists(mac_address):
+        result = self.__esp32s.get(mac_address)
+        if result is None:
             log.debug("ESP32 was not found because MAC-address was not found!")
-            return result
-        for esp32 in self.__db.ESP32s.ESP32s:
-            if esp32.Mac_Address == mac_address:
-                result = esp32
-                return result
         return result
 
     def add_shelf(self, shelf: Shelf) -> bool:
@@ -488,19 +760,19 @@ class DataManager:
             log.warning("Cannot add Shelf because there "
                         "is already one with the same ShelfNumber!")
             return result
-        if not self.mac_address_exists(shelf.Mac_Address):
+        esp32 = self.get_esp32_by_mac_address(shelf.Mac_Address)
+        if esp32 is None:
             log.debug("Given Mac_Address was not found in the database, so cannot add Shelf. In "
                       "order to add a Shelf the Mac_Address has to exist and its attribute isUsed "
                       "has to be False.")
-        esp32 = self.get_esp32_by_mac_address(shelf.Mac_Address)
-        if esp32 is None:
             return result
         if esp32.isUsed:
             log.debug("Cannot add Shelf because the ESP32 with the given Mac_Address is being "
                       "used by another shelf.")
             return result
-        esp32.isUsed = True
+        self.mark_used(esp32)
         self.__db.Shelves.Shelves.append(shelf)
+        self.__index_shelf(shelf)
         self.save_data()
         result = True
         return result
@@ -521,29 +793,54 @@ class DataManager:
         False if the Shelf could not be deleted from the database.
         """
         result = False
-        shelf = self.get_shelf_by_shelf_number(shelf_number)
+        shelf = self.__shelves.get(shelf_number)
         if shelf is None:
             log.debug("Cannot delete shelf with shelf number %d because it doesn't exist "
                       "in our database.", shelf_number)
             return result
-        mac_address = self.get_mac_address_by_shelf_number(shelf_number)
-        esp32 = self.get_esp32_by_mac_address(mac_address)
-        if mac_address is None or esp32 is None:
+        esp32 = self.__esp32s.get(shelf.Mac_Address)
+        if esp32 is None:
             log.debug("There isn't an ESP32 assigned to the Shelf with shelf number %d "
                       "so cannot delete it.", shelf_number)
             return result
-        try:
-            self.__db.Shelves.Shelves.remove(shelf)
-        except ValueError:
-            log.warning("Couldn't remove shelf because value is not present (ValueError). The "
-                        "given shelf must be exactly like the one in the database that has to be "
-                        "deleted.")
+        shelves = self.__db.Shelves.Shelves
+        # compared by identity, comparing pydantic models would serialize each of them
+        for index, stored_shelf in enumerate(shelves):
+            if stored_shelf is shelf:
+                del shelves[index]
+                break
+        else:
+            log.warning("Couldn't remove shelf because it is not present in the database.")
             return result
-        esp32.isUsed = False
+        self.__unindex_shelf(shelf)
+        self.mark_unused(esp32)
         self.save_data()
         result = True
         return result
 
+    def __validate_new_position(self, shelf: Shelf, shelf_position: ShelfPosition
+                                ) -> Optional[str]:
+        """
+        Check if the given ShelfPosition can be added to the given Shelf, looking up the
+        indexes of the Shelf only once. Returns the reason why it can't be added or None.
+        """
+        positions = self.__positions.get(shelf.ShelfNumber)
+        if positions is None:
+            return "Cannot add ShelfPosition because given Shelf doesn't exist!"
+        if shelf_position.PositionId in positions:
+            return "Cannot add ShelfPosition because given PositionId already exists!"
+        if shelf_position.PositionId > 255 or shelf_position.PositionId < 0:
+            return "Cannot add ShelfPosition because given PositionId is not between 0-255."
+        if not shelf_position.LEDs:
+            return "Cannot add ShelfPosition because given LEDs is empty or None"
+        used_leds = self.__leds[shelf.ShelfNumber]
+        for led in shelf_position.LEDs:
+            if led in used_leds:
+                return (f"Cannot add ShelfPosition because the given LED {led} is equal to an "
+                        f"existing one in the position with the id {used_leds[led]} in the Shelf "
+                        f"with the number {shelf.ShelfNumber}")
+        return None
+
     def add_position(self, shelf: Shelf, shelf_position: ShelfPosition) -> bool:
         """
         Method to add a ShelfPosition to a Shelf in the database.
@@ -567,26 +864,17 @@ class DataManager:
         if not isinstance(shelf_position, ShelfPosition):
             log.warning("ShelfPosition is None or not a valid instance of ShelfPosition!")
             return result
-        if not self.shelf_exists(shelf.ShelfNumber):
-            log.warning("Cannot add ShelfPosition because given Shelf doesn't exist!")
-            return result
-        if self.position_id_exists(shelf.ShelfNumber, shelf_position.PositionId):
-            log.warning("Cannot add ShelfPosition because given PositionId already exists!")
-            return result
-        if shelf_position.PositionId > 255 or shelf_position.PositionId < 0:
-            log.warning("Cannot add ShelfPosition "
-                        "because given PositionId is not between 0-255.")
-            return result
-        if not shelf_position.LEDs or shelf_position.LEDs is None:
-            log.warning("Cannot add ShelfPosition because given LEDs is empty or None")
-            return result
-        if self.leds_exists(shelf_position.LEDs, shelf_position.ShelfNumber):
-            log.warning("Warning: Cannot add ShelfPosition because one of the given LEDs is equal "
-                        "to an existing one in the position with the id %d in the Shelf with the "
-                        "number %d", shelf_position.PositionId, shelf_position.ShelfNumber)
+        reason = self.__validate_new_position(shelf, shelf_position)
+        if reason is not None:
+            log.warning(reason)
             return result
         shelf_position.ShelfNumber = shelf.ShelfNumber
         shelf.Positions.append(shelf_position)
+        self.__positions[shelf.ShelfNumber][shelf_position.PositionId] = shelf_position
+        used_leds = self.__leds[shelf.ShelfNumber]
+        for led in shelf_position.LEDs:
+            used_leds[led] = shelf_position.PositionId
+        self.__changed_shelves.add(shelf.ShelfNumber)
         self.save_data()
         result = True
         return result
@@ -614,10 +902,12 @@ class DataManager:
         if (shelf_position is None) or (not isinstance(shelf_position, ShelfPosition)):
             log.warning("ShelfPosition is None or not a valid instance of ShelfPosition!")
             return result
-        if not self.shelf_exists(shelf.ShelfNumber):
+        positions = self.__positions.get(shelf.ShelfNumber)
+        if positions is None:
             log.warning("Cannot add ShelfPosition because given Shelf doesn't exist!")
             return result
-        if not self.position_id_exists(shelf.ShelfNumber, shelf_position.PositionId):
+        position_to_be_updated = positions.get(shelf_position.PositionId)
+        if position_to_be_updated is None:
             log.warning("Cannot update ShelfPosition because given PositionId doesn't exist "
                         "in our database!")
             return result
@@ -629,12 +919,14 @@ class DataManager:
             log.warning("Cannot update ShelfPosition because one of the given LEDs is "
                         "equal to another existing one.")
             return result
-        position_to_be_updated = \
-            self.get_position_by_shelf_number_and_position_id(shelf.ShelfNumber,
-                                                              shelf_position.PositionId)
 
+        used_leds = self.__leds[shelf.ShelfNumber]
+        self.__unindex_leds(used_leds, position_to_be_updated)
+        for led in shelf_position.LEDs:
+            used_leds[led] = shelf_position.PositionId
         position_to_be_updated.ShelfNumber = shelf.ShelfNumber
         position_to_be_updated.LEDs = shelf_position.LEDs
+        self.__changed_shelves.add(shelf.ShelfNumber)
         self.save_data()
         result = True
         return result
@@ -661,11 +953,12 @@ class DataManager:
         if (shelf_position is None) or (not isinstance(shelf_position, ShelfPosition)):
             log.warning("ShelfPosition is None or not a valid instance of ShelfPosition!")
             return False
-        if not self.shelf_exists(shelf.ShelfNumber):
+        positions = self.__positions.get(shelf.ShelfNumber)
+        if positions is None:
             log.warning("Cannot delete ShelfPosition because "
                         "given Shelf doesn't exist in the database!")
             return False
-        if not self.position_id_exists(shelf.ShelfNumber, shelf_position.PositionId):
+        if shelf_position.PositionId not in positions:
             log.warning("Cannot delete ShelfPosition because "
                         "given PositionId doesn't exist in the database!")
             return False
@@ -678,6 +971,37 @@ class DataManager:
                         "the one in the database that has to be deleted.")
             return False
 
+        positions.pop(shelf_position.PositionId, None)
+        self.__unindex_leds(self.__leds[shelf.ShelfNumber], shelf_position)
+        self.__changed_shelves.add(shelf.ShelfNumber)
+        self.save_data()
+        return True
+
+    def clear_positions(self, shelf: Shelf) -> bool:
+        """
+        Method to delete all ShelfPositions of a Shelf in the database while keeping the Shelf.
+
+        Parameters
+        ---------
+        shelf : Shelf
+        Shelf whose ShelfPositions have to be deleted.
+
+        Returns
+        -------
+        True if the ShelfPositions could be deleted from the Shelf in the database.
+        False if the Shelf is not stored in the database.
+        """
+        if (shelf is None) or (not isinstance(shelf, Shelf)):
+            log.warning("Shelf is None or not a valid instance of Shelf!")
+            return False
+        if self.__shelves.get(shelf.ShelfNumber) is not shelf:
+            log.warning("Cannot clear ShelfPositions because given Shelf "
+                        "is not the one stored in the database!")
+            return False
+        shelf.Positions.clear()
+        self.__positions[shelf.ShelfNumber].clear()
+        self.__leds[shelf.ShelfNumber].clear()
+        self.__changed_shelves.add(shelf.ShelfNumber)
         self.save_data()
         return True
 
@@ -703,14 +1027,29 @@ class DataManager:
             log.warning("Cannot add ESP32 because given Mac_Address already exists!")
             return False
         self.__db.ESP32s.ESP32s.append(esp32)
+        self.__esp32s[esp32.Mac_Address] = esp32
+        if not esp32.isUsed:
+            self.__unused_mac_addresses[esp32.Mac_Address] = None
         self.save_data()
         return True
 
-    def set_all_esp32s_offline(self) -> None:
+    def set_all_esp32s_offline(self) -> bool:
+        """
+        Sets the attribute isOnline of every ESP32 stored in the database to False.
+
+        Returns
+        -------
+        True if at least one ESP32 was online, so the database has changed.
+        False if all ESP32s were already offline or there are no ESP32s.
+        """
         esp32s = self.get_esp32_array()
         if esp32s is None or not esp32s.ESP32s:
             log.warning("Couldn't set any ESP32s offline because the ESP32Array object of the DB object is None or "
                         "the List[ESP32] is empty.")
-            return
+            return False
+        changed = False
         for esp32 in esp32s.ESP32s:
-            esp32.isOnline = False
+            if esp32.isOnline:
+                esp32.isOnline = False
+                changed = True
+        return changed
@@ -1,11 +1,26 @@
 """Submodule that manages the MQTT communication between the HttpToMqtt Server and ESP32s"""
 
+import asyncio
+from collections import deque
 import json
-from logging import getLogger
-import random
+import queue
+import re
+from logging import DEBUG, getLogger
+import socket
+import sys
+import threading
 import time
+from typing import Optional
 import paho.mqtt.client as mqtt
-from HttpToMqtt.Types import ACK, ESP32, ShelfPosition, Shelf
+from HttpToMqtt.Types import ESP32, MAC_ADDRESS_REGEX, ShelfPosition, Shelf
+
+# seconds in which commands to an ESP32 that missed an ACK fail without being sent
+UNRESPONSIVE_TTL = 30
+
+# New ESP32s may only register with MAC-addresses that the API accepts, otherwise
+# they couldn't be assigned to a shelf or reset afterwards. Already stored ESP32s
+# are accepted regardless, so they don't drop out of older databases.
+MAC_ADDRESS_PATTERN = re.compile(MAC_ADDRESS_REGEX)
 
 log = getLogger(__name__)
 
@@ -25,10 +40,27 @@ class Mqtt:
         data_manager : DataManager
             Object representing the data manager
             that adds, updates, finds and deletes data from the JSON database.
-        light_ack_queue : list[ACK]
-            Queue for the ACKs coming from all operations over the pbl/+/light MQTT topic.
-        config_ack_queue : list[ACK]
-            Queue for the ACKs coming from all operations over the pbl/+/config MQTT topic.
+        __ack_waiters : dict[str, dict[tuple[str, int], asyncio.Future]]
+            Futures of publish_with_ack_async calls waiting for an ACK, keyed by the
+            select_queue name ("light_ack" or "config_ack") and then by (MAC-address, ACK_id).
+            The thread of the MQTT client resolves them when the ACK arrives.
+        __free_ack_ids : dict[tuple[str, str], deque[int]]
+            ACK_ids that no call is waiting for, keyed by (select_queue, MAC-address).
+            IDs are taken from the front and freed IDs are appended, so an ID is only
+            reused after all others have been used.
+        __ack_lock : threading.Lock
+            Guards __ack_waiters and __free_ack_ids, which are shared with the thread
+            of the MQTT client.
+        __unresponsive : dict[str, float]
+            Maps the MAC-address of an ESP32 that didn't send an ACK in time to the
+            time.monotonic() of the timeout or offline message. Cleared by any ACK or
+            register message of the ESP32.
+        __work_queue : queue.Queue
+            Messages of the register, config/put and config/offline topics together with
+            their callbacks, waiting to be handled by __worker.
+        __worker : threading.Thread
+            Daemon thread that runs the queued callbacks, so the thread of the MQTT client
+            doesn't wait for the database and can go on receiving ACKs.
         config : dict
             Object representing the deserialized JSON file in conf_path.
         client : paho.mqtt.client.Client
@@ -52,8 +84,13 @@ class Mqtt:
 
         self.conf_path: str = path
         self.data_manager = data_manager
-        self.config_ack_queue: list[ACK] = []
-        self.light_ack_queue: list[ACK] = []
+        self.__ack_waiters: dict[str, dict[tuple[str, int], asyncio.Future]] = {
+            "light_ack": {}, "config_ack": {}}
+        self.__free_ack_ids: dict[tuple[str, str], deque[int]] = {}
+        self.__ack_lock = threading.Lock()
+        self.__unresponsive: dict[str, float] = {}
+        self.__work_queue: queue.Queue = queue.Queue()
+        self.__worker = threading.Thread(target=self.__work, name="Mqtt-worker", daemon=True)
         with open(self.conf_path, encoding="utf-8") as fp:
             self.config = json.load(fp)
 
@@ -64,6 +101,7 @@ class Mqtt:
         Registers the callbacks for the MQTT client and connects it to the
         specified MQTT-broker in the configuration JSON file. Then it starts
         the loops that receive messages and handles them.
+        Messages that change the database are handled by a worker thread.
 
         Returns
         -------
@@ -71,16 +109,106 @@ class Mqtt:
         """
 
         self.__create_callbacks()
+        self.__worker.start()
         self.client.connect(self.config["server"],
                             self.config["port"],
                             self.config["keepalive"])
         log.info("Successfully connected MQTT-Client to %s on port %s.",
-                 str(self.config['server']), str(self.config['port']))
+                 self.config['server'], self.config['port'])
         self.client.loop_start()
         return self.client
 
-    def publish_with_ack(self, timeout: int, mac_address: str, select_queue: str, topic: str,
-                         payload: bytearray) -> int:
+    def __work(self) -> None:
+        """
+        Loop of the worker thread. Runs the queued callbacks one after another,
+        in the order their messages arrived.
+        """
+        while True:
+            callback, client, userdata, msg = self.__work_queue.get()
+            try:
+                callback(client, userdata, msg)
+            except Exception:
+                log.exception("Failed to handle message on %s", msg.topic)
+            finally:
+                self.__work_queue.task_done()
+
+    def is_unresponsive(self, mac_address: str) -> bool:
+        """
+        Returns True if the ESP32 with the given MAC-address missed an ACK or went offline
+        less than UNRESPONSIVE_TTL seconds ago and hasn't been heard of since. Commands to
+        such an ESP32 fail with 504 without being published.
+
+        Parameters
+        ----------
+        mac_address : str
+            String representing the MAC-address of the ESP32.
+
+        Returns
+        -------
+        True if commands to the ESP32 currently fail without being published.
+        """
+        timed_out_at = self.__unresponsive.get(mac_address)
+        if timed_out_at is None:
+            return False
+        elapsed = time.monotonic() - timed_out_at
+        if elapsed < UNRESPONSIVE_TTL:
+            log.debug("Not publishing to %s because it missed an ACK %.1f seconds ago.",
+                      mac_address, elapsed)
+            return True
+        self.__unresponsive.pop(mac_address, None)
+        return False
+
+    def __publish(self, select_queue: str, mac_address: str, ack_id: int, topic: str,
+                  payload: bytes, *, qos: int) -> bool:
+        """
+        Publishes the payload prefixed with the ACK_id to the topic. Returns False if the
+        message couldn't even be queued by the MQTT client (e.g. because it is not connected
+        to the broker). Then no ACK can come, so the waiter is removed at once instead of
+        letting the caller wait for the timeout.
+        """
+        info = self.client.publish(topic, payload=bytes((ack_id,)) + payload, qos=qos)
+        if info.rc == mqtt.MQTT_ERR_SUCCESS:
+            return True
+        log.warning("Couldn't publish to %s: %s", topic, mqtt.error_string(info.rc))
+        self.__remove_ack_waiter(select_queue, mac_address, ack_id)
+        return False
+
+    def __add_ack_waiter(self, select_queue: str, mac_address: str,
+                         waiter: asyncio.Future) -> Optional[int]:
+        """
+        Registers the waiter for an ACK of the ESP32 with the given MAC-address under
+        an ACK_id that no other call is waiting for and returns the ACK_id.
+        Returns None if all 256 ACK_ids of the ESP32 are in use.
+        """
+        key = (select_queue, mac_address)
+        with self.__ack_lock:
+            free_ack_ids = self.__free_ack_ids.get(key)
+            if free_ack_ids is None:
+                # the ACK_ids are in the range between 0 and 255
+                # because they are meant to be a single byte
+                free_ack_ids = self.__free_ack_ids[key] = deque(range(256))
+            if not free_ack_ids:
+                log.warning("All ACK IDs for %s are in use.", mac_address)
+                return None
+            ack_id = free_ack_ids.popleft()
+            self.__ack_waiters[select_queue][(mac_address, ack_id)] = waiter
+        return ack_id
+
+    def __remove_ack_waiter(self, select_queue: str, mac_address: str,
+                            ack_id: int) -> Optional[asyncio.Future]:
+        """
+        Removes the waiter for the ACK with the given ACK_id of the ESP32 with the
+        given MAC-address and frees the ACK_id. Returns the waiter, or None if no
+        call is waiting for the ACK.
+        """
+        with self.__ack_lock:
+            waiter = self.__ack_waiters[select_queue].pop((mac_address, ack_id), None)
+            if waiter is not None:
+                self.__free_ack_ids[(select_queue, mac_address)].append(ack_id)
+        return waiter
+
+    async def publish_with_ack_async(self, timeout: int, mac_address: str, select_queue: str,
+                                     topic: str, payload: bytes, *, qos: int = 0) -> int:
         """
         Publishes a MQTT message (payload) to the specified topic using the
         specified select_queue ("light_ack" or "config_ack") in order to
@@ -89,6 +217,12 @@ class Mqtt:
         If in 'timeout' seconds an ACK has not returned from the ESP32
         to which the message was sent the status code 504 (HTTP_504_GATEWAY_TIMEOUT)
         is returned. After an ACK has come the status code 200 (HTTP_200_OK) is returned.
+        If the ESP32 missed an ACK in the last UNRESPONSIVE_TTL seconds and hasn't sent
+        an ACK or register message since, 504 is returned at once without publishing.
+
+        Instead of blocking a thread, the call waits on an asyncio.Future that the MQTT client
+        thread resolves as soon as the matching ACK arrives, so any number of commands can
+        wait for their ACKs concurrently on the event loop.
 
         Parameters
         ----------
@@ -101,8 +235,11 @@ class Mqtt:
             two possible values, "light_ack" or "config_ack".
         topic : str
             MQTT topic to which the message should be published.
-        payload : bytearray
-            Byte array containing the raw data to be sent.
+        payload : bytes
+            Bytes containing the raw data to be sent.
+        qos : int
+            MQTT quality of service of the message. Defaults to 0 because the ACK of the ESP32
+            already confirms the delivery end-to-end, a PUBACK of the broker adds nothing.
 
         Returns
         -------
@@ -112,52 +249,30 @@ class Mqtt:
         status code 200 (HTTP_200_OK) is returned.
         """
 
-        # choosing right queue
-        queue = None
-        if select_queue == "light_ack":
-            queue = self.light_ack_queue
-        if select_queue == "config_ack":
-            queue = self.config_ack_queue
-        if queue is None:
+        if select_queue not in self.__ack_waiters:
             raise Exception("Didn't choose the right queue: either light_ack or config_ack")
-
-        # generating a random ID for the outgoing ACK
-        # in the range between 0 and 255 because the IDs are
-        # meant to be a single byte
-        random_ack_id = random.randint(0, 255)
-        log.debug("random_ack_id = %d", random_ack_id)
-
-        # creating the outgoing ACK
-        outgoing_ack = ACK(Mac_Address=mac_address, ACK_id=random_ack_id)
-
-        # checking if the created outgoing_ack doesn't exist in the
-        # light_ack_queue. If it does then a new ID is generated.
-        # repeat until we have an outgoing_ack that is unique at the time of sending
-        while outgoing_ack in queue:
-            log.debug("set_leds(): had to find another random_ack_id!")
-            random_ack_id = random.randint(0, 255)
-            outgoing_ack = ACK(Mac_Address=mac_address, ACK_id=random_ack_id)
-
-        log.debug("outgoing_ack looks like this --> %s", str(outgoing_ack))
-
-        # publishing the command to the esp32 with the mac_address
-        # assigned to the provided ShelfNumber
-        payload_with_ack_id = bytearray([outgoing_ack.ACK_id])
-        log.debug("before extending %s", str(payload_with_ack_id))
-        payload_with_ack_id.extend(payload)
-        log.debug("after extending %s", str(payload_with_ack_id))
-        self.client.publish(topic, payload=payload_with_ack_id)
-
-        # registering a time_stamp to check for timeouts
-        timestamp = time.time()
-        # waiting until received outgoing_ack
-        while outgoing_ack not in queue:
-            # checking timeout
-            if time.time() - timestamp > timeout:
-                log.debug("Printing queue before timeout --> %s", str(queue))
-                return 504  # HTTP_504_GATEWAY_TIMEOUT
-        log.debug("Received ACK with ID %d! Removing %s", outgoing_ack.ACK_id, str(outgoing_ack))
-        queue.remove(outgoing_ack)
+        if self.is_unresponsive(mac_address):
+            return 504  # HTTP_504_GATEWAY_TIMEOUT
+
+        future = asyncio.get_running_loop().create_future()
+        ack_id = self.__add_ack_waiter(select_queue, mac_address, future)
+        if ack_id is None:
+            return 504  # HTTP_504_GATEWAY_TIMEOUT
+        log.debug("publish_with_ack_async(): waiting for ACK %d from %s", ack_id, mac_address)
+
+        if not self.__publish(select_queue, mac_address, ack_id, topic, payload, qos=qos):
+            return 504  # HTTP_504_GATEWAY_TIMEOUT
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.__remove_ack_waiter(select_queue, mac_address, ack_id)
+            self.__unresponsive[mac_address] = time.monotonic()
+            return 504  # HTTP_504_GATEWAY_TIMEOUT
+        except asyncio.CancelledError:
+            # e.g. on shutdown or when a gather of several commands is cancelled,
+            # otherwise the ACK_id would never be freed
+            self.__remove_ack_waiter(select_queue, mac_address, ack_id)
+            raise
         return 200
 
     def __create_callbacks(self):
@@ -191,24 +306,52 @@ class Mqtt:
             None
             """
 
-            log.info("Connected with result code %s", str(rc))
+            log.info("Connected with result code %s", rc)
 
             # Subscribing in on_connect() means that if we lose the connection and
             # reconnect then subscriptions will be renewed.
-            client.subscribe("pbl/#", 1)
-            client.subscribe("pbl/+/light/ack", 1)
-            client.subscribe("pbl/+/config/ack", 1)
-            client.subscribe("pbl/register", 1)
-            client.subscribe("pbl/+/config/put", 1)
-            client.subscribe("pbl/+/config/offline", 1)
+            # all topics are subscribed with a single SUBSCRIBE packet
+            client.subscribe([("pbl/+/light/ack", 1),
+                              ("pbl/+/config/ack", 1),
+                              ("pbl/register", 1),
+                              ("pbl/+/config/put", 1),
+                              ("pbl/+/config/offline", 1)])
+
+        def on_socket_open(_client, _userdata, sock):
+            """
+            The callback for when the socket to the broker has been opened.
+            Nagle's algorithm is disabled on it, otherwise small messages sent shortly
+            after another (e.g. while loading an ESP32) can be held back for up to 40ms
+            waiting for the TCP ACK of the previous one.
+
+            Parameters
+            -------
+            _client : Client
+                Client instance that is calling the callback.
+            _userdata :
+                User data of any type and can be set when creating a new _client
+                instance or with user_data_set(userdata).
+            sock :
+                The socket that has been opened.
+
+            Returns
+            -------
+            None
+            """
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except (AttributeError, OSError):
+                # e.g. websocket transport, which doesn't expose the TCP socket
+                log.debug("Couldn't set TCP_NODELAY on the MQTT socket.")
 
         def on_message(_client, _userdata, msg):
             """
-            The callback for when a PUBLISH-message is received from the server.
+            The callback for when a PUBLISH-message is received from the server
+            on a topic that has no specific callback.
             In this implementation just received information and the topic is printed.
-            All other callbacks are directly linked to their specific topics and
-            are not handled in this more general callback. The printing is more
-            for debugging and observing purposes.
+            All subscribed topics are directly linked to their specific callbacks,
+            so this is only a fallback for debugging and observing purposes and is
+            only registered if debug logging is enabled.
 
             Parameters
             -------
@@ -225,7 +368,7 @@ class Mqtt:
             -------
             None
             """
-            log.debug("on_message(): Received %s on %s", str(msg.payload), msg.topic)
+            log.debug("on_message(): Received %s on %s", msg.payload, msg.topic)
 
         def receive_register(_client, _userdata, msg):
             """
@@ -253,18 +396,29 @@ class Mqtt:
             None
             """
 
-            incoming_mac_address = str(msg.payload)[2:-1]
-            if self.data_manager.mac_address_exists(incoming_mac_address):
-                esp32 = self.data_manager.get_esp32_by_mac_address(incoming_mac_address)
-                esp32.isOnline = True
-                self.data_manager.save_data()
-                log.debug("ESP32 with %s is back online!", incoming_mac_address)
+            try:
+                incoming_mac_address = sys.intern(msg.payload.decode("ascii"))
+            except UnicodeDecodeError:
+                log.warning("Ignoring register message with invalid MAC-address %s", msg.payload)
+                return
+            esp32 = self.data_manager.get_esp32_by_mac_address(incoming_mac_address)
+            if esp32 is None and MAC_ADDRESS_PATTERN.fullmatch(incoming_mac_address) is None:
+                log.warning("Ignoring register message with invalid MAC-address %s",
+                            incoming_mac_address)
+                return
+            self.__unresponsive.pop(incoming_mac_address, None)
+            if esp32 is not None:
+                # periodic register messages of ESP32s that are online change nothing
+                if not esp32.isOnline:
+                    esp32.isOnline = True
+                    self.data_manager.save_data()
+                    log.debug("ESP32 with %s is back online!", incoming_mac_address)
             else:
                 esp32 = ESP32(Mac_Address=incoming_mac_address, isUsed=False, isOnline=True)
                 if self.data_manager.add_esp32(esp32):
-                    log.info("Successfully added the ESP32 %s to the database!", str(esp32))
+                    log.info("Successfully added the ESP32 %s to the database!", esp32)
                 else:
-                    log.warning("Couldn't add ESP32 %s to the database.", str(esp32))
+                    log.warning("Couldn't add ESP32 %s to the database.", esp32)
 
         def config_offline(_client, _userdata, msg):
             """
@@ -287,19 +441,19 @@ class Mqtt:
             -------
             None
             """
-            split_topic = msg.topic.split('/')
-            mac_address = split_topic[1]
+            mac_address = mac_address_from_topic(msg.topic)
             log.debug("config_offline(): Extracted mac_address = %s", mac_address)
-            if self.data_manager.mac_address_exists(mac_address):
-                esp32 = self.data_manager.get_esp32_by_mac_address(mac_address)
+            self.__unresponsive[mac_address] = time.monotonic()
+            esp32 = self.data_manager.get_esp32_by_mac_address(mac_address)
+            if esp32 is not None and esp32.isOnline:
                 esp32.isOnline = False
                 self.data_manager.save_data()
                 log.info("ESP32 with %s disgracefully disconnected!", mac_address)
 
         def receive_config_ack(_client, _userdata, msg):
             """
-            Callback that places an incoming ACK in the config_ack_queue using
-            the general receive_ack method.
+            Callback that hands an incoming ACK to the call waiting for it on the
+            config topic using the general receive_ack method.
 
             Parameters
             -------
@@ -316,12 +470,12 @@ class Mqtt:
             -------
             None
             """
-            receive_ack(msg, self.config_ack_queue)
+            receive_ack(msg, "config_ack")
 
         def receive_light_ack(_client, _userdata, msg):
             """
-            Callback that places an incoming ACK in the light_ack_queue using
-            the general receive_ack method.
+            Callback that hands an incoming ACK to the call waiting for it on the
+            light topic using the general receive_ack method.
 
             Parameters
             -------
@@ -338,38 +492,68 @@ class Mqtt:
             -------
             None
             """
-            receive_ack(msg, self.light_ack_queue)
+            receive_ack(msg, "light_ack")
 
-        def receive_ack(msg, queue):
+        def receive_ack(msg, select_queue):
             """
-            Callback that places an incoming ACK in the specified queue. It extracts
-            the needed MAC address from the topic and the ACK ID from the payload.
+            Callback that hands an incoming ACK to the publish_with_ack_async
+            call waiting for it. It extracts the needed
+            MAC address from the topic and the ACK ID from the payload.
+            ACKs nobody is waiting for (anymore) are dropped.
 
             Parameters
             -------
             msg :
                 Object containing the topic (msg.topic) and the bytes (msg.payload)
                 sent to this.
-            queue :
-                Queue to which the incoming ACK will be appended to.
+            select_queue :
+                Name of the topic the ACK came in on, either "light_ack" or "config_ack".
 
             Returns
             -------
             None
             """
 
-            split_topic = msg.topic.split('/')
-            mac_address = split_topic[1]
+            mac_address = mac_address_from_topic(msg.topic)
             log.debug("receive_ack(): Extracted mac_address = %s", mac_address)
-            # ack_id_as_string = str(msg.payload)[2:-1]
-            ack_id = int.from_bytes(bytearray([msg.payload[0]]), 'big')
-            # ack_id = int.from_bytes(msg.payload, byteorder='big')
-            # ack_id = int(str(msg.payload)[2:-1])
+            self.__unresponsive.pop(mac_address, None)
+            ack_id = msg.payload[0]
+
+            waiter = self.__remove_ack_waiter(select_queue, mac_address, ack_id)
+            if waiter is None:
+                log.debug("receive_ack(): nobody is waiting for ACK %d from %s",
+                          ack_id, mac_address)
+            else:
+                # futures are not thread-safe, so they are resolved on their event loop
+                waiter.get_loop().call_soon_threadsafe(resolve_future, waiter)
+                log.debug("receive_ack(): resolved future for ACK %d from %s",
+                          ack_id, mac_address)
+
+        def deferred(callback):
+            """
+            Returns a callback that only queues the message for the worker thread,
+            which then calls the given callback with it. ACKs are not deferred, the
+            calls waiting for them are woken up directly by the thread of the MQTT client.
+            """
+            def defer(client, userdata, msg):
+                self.__work_queue.put((callback, client, userdata, msg))
+            return defer
 
-            received_ack = ACK(Mac_Address=mac_address, ACK_id=ack_id)
-            log.debug("received ack = %s", str(received_ack))
-            queue.append(received_ack)
-            log.debug("Appended %s to %s", str(received_ack), str(queue))
+        def mac_address_from_topic(topic: str) -> str:
+            """
+            Returns the MAC-address in a topic of the form pbl/MAC-address/...
+            without splitting the whole topic. The MAC-address is interned, so all
+            messages of an ESP32 share a single string whose hash is computed once.
+            """
+            return sys.intern(topic.partition('/')[2].partition('/')[0])
+
+        def resolve_future(future: asyncio.Future):
+            """
+            Marks the future of a publish_with_ack_async call as done, unless
+            it has already been cancelled because of a timeout.
+            """
+            if not future.done():
+                future.set_result(None)
 
         def config_put(_client, _userdata, msg):
             """
@@ -396,38 +580,38 @@ class Mqtt:
             -------
             None
             """
-            split_topic = msg.topic.split('/')
-            mac_address = split_topic[1]
-            log.debug("config_put(): Extracted mac_address = %s", str(mac_address))
+            mac_address = mac_address_from_topic(msg.topic)
+            log.debug("config_put(): Extracted mac_address = %s", mac_address)
             shelf: Shelf = self.data_manager.get_shelf_by_mac_address(mac_address)
             if shelf is None:
                 log.warning("Couldn't create position because there is no "
-                            "shelf with the MAC-address %s", str(mac_address))
+                            "shelf with the MAC-address %s", mac_address)
                 return
-            position_id = int.from_bytes(bytearray([msg.payload[0]]), 'big')
-            leds: list[int] = []
-            for byte in msg.payload[1:]:
-                leds.append(byte)
+            position_id = msg.payload[0]
+            leds: list[int] = list(msg.payload[1:])
             if not leds:
                 log.warning("Couldn't create position because no LEDs were given for the position. "
                             "In other words, msg.payload didn't have any data after the first "
                             "byte which is the position id.")
                 return
-            shelf_position: ShelfPosition = ShelfPosition(ShelfNumber=shelf.ShelfNumber,
-                                                          PositionId=position_id,
-                                                          LEDs=leds)
+            # every value comes from a byte of the payload and is in range, so the
+            # validation of ShelfPosition can be skipped
+            shelf_position: ShelfPosition = ShelfPosition.construct(
+                ShelfNumber=shelf.ShelfNumber, PositionId=position_id, LEDs=leds)
             if self.data_manager.add_position(shelf, shelf_position):
                 log.info("Successfully added position %s "
-                         "to shelf with number %d", str(shelf_position), shelf.ShelfNumber)
+                         "to shelf with number %d", shelf_position, shelf.ShelfNumber)
                 return
             log.warning("Couldn't add position %s to shelf with number %d",
-                        str(shelf_position), shelf.ShelfNumber)
+                        shelf_position, shelf.ShelfNumber)
 
         # registering callbacks to the specified functions
         self.client.on_connect = on_connect
-        self.client.on_message = on_message
+        self.client.on_socket_open = on_socket_open
+        if log.isEnabledFor(DEBUG):
+            self.client.on_message = on_message
         self.client.message_callback_add("pbl/+/light/ack", receive_light_ack)
         self.client.message_callback_add("pbl/+/config/ack", receive_config_ack)
-        self.client.message_callback_add("pbl/register", receive_register)
-        self.client.message_callback_add("pbl/+/config/put", config_put)
-        self.client.message_callback_add("pbl/+/config/offline", config_offline)
+        self.client.message_callback_add("pbl/register", deferred(receive_register))
+        self.client.message_callback_add("pbl/+/config/put", deferred(config_put))
+        self.client.message_callback_add("pbl/+/config/offline", deferred(config_offline))
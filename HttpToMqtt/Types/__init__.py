@@ -1,19 +1,31 @@
 # pylint: disable=no-name-in-module
 from typing import List
-from pydantic import BaseModel
+from pydantic import BaseModel, conint, constr
+
+# PositionIds and LEDs are sent to the ESP32s as single bytes, so they have to be in range 0-255.
+# Request bodies using this type are rejected by FastAPI (HTTP 422) before a route is executed.
+ByteInt = conint(ge=0, le=255)
+
+# MAC-addresses sent by clients have to be in the format "3C:71:BF:AA:73:F0". Malformed ones are
+# rejected by FastAPI (HTTP 422) instead of being looked up in the database. Unknown ESP32s
+# registering over MQTT with a MAC-address in another format are ignored, so every newly stored
+# ESP32 is addressable.
+MAC_ADDRESS_REGEX = r"^[0-9A-Fa-f]{2}(:[0-9A-Fa-f]{2}){5}$"
+MacAddress = constr(regex=MAC_ADDRESS_REGEX)
 
 
 class TurnOn(BaseModel):
     """
     Dataclass to turn LEDs on in
     the given Shelf at the given position.
-    Post-body for light/turnOn.
+    Post-body for light/turnOn. A list of them is the
+    post-body for light/setManyShelves.
 
     Attributes
     ----------
     ShelfNumber : int
     ShelfNumber of the Shelf on which LEDs should be turned on.
-    PositionId : int
+    PositionId : ByteInt
     PositionId of the ShelfPosition on which LEDs should be turned on.
     Color : str
     String containing the RGB values with which the LEDs should be turned on.
@@ -21,7 +33,7 @@ class TurnOn(BaseModel):
     """
 
     ShelfNumber: int
-    PositionId: int
+    PositionId: ByteInt
     Color: str  # Format: "#FFFFFF"
 
 
@@ -35,12 +47,12 @@ class TurnOff(BaseModel):
     ----------
     ShelfNumber : int
     ShelfNumber of the Shelf on which LEDs should be turned off.
-    PositionId : int
+    PositionId : ByteInt
     PositionId of the ShelfPosition on which LEDs should be turned off.
     """
 
     ShelfNumber: int
-    PositionId: int
+    PositionId: ByteInt
 
 
 class DeletePosition(BaseModel):
@@ -54,12 +66,12 @@ class DeletePosition(BaseModel):
     ----------
     ShelfNumber : int
     ShelfNumber of the Shelf of which a ShelfPosition has to be deleted.
-    PositionId : int
+    PositionId : ByteInt
     PositionId of the ShelfPosition that has to be deleted.
     """
 
     ShelfNumber: int
-    PositionId: int
+    PositionId: ByteInt
 
 
 class ShelfSelection(BaseModel):
@@ -105,17 +117,17 @@ class SetLED(BaseModel):
 
     Attributes
     ----------
-    Mac_Address: str
+    Mac_Address: MacAddress
     MAC-Address of the ESP32 on which the LEDs should be set (turned on).
-    LEDs: List[int]
+    LEDs: List[ByteInt]
     List of integer values representing the LEDs that should be set (turned on).
     Color: str
     String containing the RGB values with which the LEDs should be set (turned on).
     The format of the string has to be #FFFFFF.
     """
 
-    Mac_Address: str
-    LEDs: List[int]
+    Mac_Address: MacAddress
+    LEDs: List[ByteInt]
     Color: str
 
 
@@ -128,14 +140,14 @@ class UnsetLED(BaseModel):
 
     Attributes
     ----------
-    Mac_Address: str
+    Mac_Address: MacAddress
     MAC-Address of the ESP32 on which the LEDs should be unset (turned off).
-    LEDs: List[int]
+    LEDs: List[ByteInt]
     List of integer values representing the LEDs that should be unset (turned off).
     """
 
-    Mac_Address: str
-    LEDs: List[int]
+    Mac_Address: MacAddress
+    LEDs: List[ByteInt]
 
 
 class ResetESP32(BaseModel):
@@ -145,11 +157,11 @@ class ResetESP32(BaseModel):
 
     Attributes
     ----------
-    Mac_Address: str
+    Mac_Address: MacAddress
     MAC-Address of the ESP32 that has to be reset.
     """
 
-    Mac_Address: str
+    Mac_Address: MacAddress
 
 
 class ShelfPosition(BaseModel):
@@ -164,16 +176,16 @@ class ShelfPosition(BaseModel):
     ----------
     ShelfNumber : int
     ShelfNumber of the Shelf in which this ShelfPosition is stored.
-    PositionId : int
+    PositionId : ByteInt
     PositionId of the ShelfPosition that uniquely identifies this position on the Shelf.
-    LEDs: List[int]
+    LEDs: List[ByteInt]
     List of integer values representing the LEDs that belong to this ShelfPosition.
     These integer values are in the range 0-255 (a byte sized unsigned integer).
     """
 
     ShelfNumber: int
-    PositionId: int
-    LEDs: List[int] = []
+    PositionId: ByteInt
+    LEDs: List[ByteInt] = []
 
 
 class Shelf(BaseModel):
@@ -252,26 +264,6 @@ class ESP32Array(BaseModel):
     ESP32s: List[ESP32] = []
 
 
-class ACK(BaseModel):
-    """
-    Dataclass representing an ACK.
-    ACKs are used to ensure that messages were sent to
-    ESP32s and that these were able to do the needed operations.
-    An ACK has a unique ID that is used to identify it while waiting for it
-    on the server side. After it has been received it is removed from the queue.
-
-    Attributes
-    ----------
-    Mac_Address: str
-    MAC-Address of the ESP32 that is sending the ACK.
-    ACK_id: int
-    ID that uniquely identifies the ACK being sent and received. With this
-    ID it is possible to uniquely identify operations performed by the ESP32s.
-    """
-    Mac_Address: str
-    ACK_id: int
-
-
 class DB(BaseModel):
     """
     Dataclass representing the database managed by the class
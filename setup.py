@@ -3,7 +3,9 @@ from distutils.core import setup
 
 REQUIREMENTS = ["fastapi",
                 "pydantic",
-                "paho-mqtt"]
+                "paho-mqtt",
+                "orjson",
+                "uvicorn[standard]"]
 
 setup(
     name='HttpToMqtt',